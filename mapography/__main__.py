@@ -2,8 +2,10 @@
 
 import sys
 import argparse
+import contextlib
 
-from mapography import parser, commands
+from mapography import parser, commands, reader, cache, profiling, parallel
+from mapography import watch, mapfile
 
 __author__ = "Franck PARAT"
 
@@ -15,10 +17,82 @@ PARSERS = {
 VIEWERS = {}
 
 COMMANDS = {
-    'calls': ['tree', 'paths', 'longest'],  # function calls
-    'modules': ['list', 'sizes']
+    'calls': ['tree', 'paths', 'longest', 'cycles', 'callers',
+              'function'],  # function calls
+    'modules': ['list', 'sizes'],
+    'lookup': ['addresses'],  # what owns addresses
+    'symbols': ['list', 'unused', 'uses'],
+    'diff': ['sections', 'modules', 'functions', 'symbols', 'all'],
+    'export': ['jsonl', 'columnar']  # parsed model for other tools
 }
 
+_DIFF_OPTIONS = [
+    (['--base'], dict(required=True, metavar='BASE_FILE',
+                      help='Map file to compare the input file with')),
+    (['--sequential'], dict(dest='parallel', action='store_false',
+                            help='Parse the maps one after the other instead '
+                                 'of in parallel'))
+]
+
+# Options of the subcommands: lists of (flags, keyword arguments) for
+# ArgumentParser.add_argument. They are passed to the command functions as
+# keyword arguments.
+OPTIONS = {
+    ('calls', 'tree'): [
+        (['--max-depth'], dict(type=int, help='Maximum depth of the tree')),
+        (['--collapse'], dict(action='store_true',
+                              help='Draw the calls of a function only the '
+                                   'first time it is met'))
+    ],
+    ('calls', 'paths'): [
+        (['--max-depth'], dict(type=int, help='Maximum length of the paths')),
+        (['--min-stack'], dict(type=int, metavar='BYTES',
+                               help='Only the paths using at least BYTES of '
+                                    'stack')),
+        (['--top'], dict(type=int, metavar='N',
+                         help='Only the N paths using the most stack'))
+    ],
+    ('calls', 'callers'): [
+        (['name'], dict(help='Function name')),
+        (['--transitive'], dict(action='store_true',
+                                help='All the functions from which the '
+                                     'function can be called, nearest first'))
+    ],
+    ('calls', 'function'): [
+        (['name'], dict(help='Function name'))
+    ],
+    ('modules', 'sizes'): [
+        (['--totals'], dict(action='store_true',
+                            help='Add the total size of each section')),
+        (['--percent'], dict(action='store_true',
+                             help='Add the share of the section total')),
+        (['--rollup'], dict(type=int, metavar='DEPTH',
+                            help='Group the modules by their first DEPTH '
+                                 'directories'))
+    ],
+    ('symbols', 'uses'): [
+        (['--module'], dict(help='Only the symbols used by this module'))
+    ],
+    ('diff', 'sections'): _DIFF_OPTIONS,
+    ('diff', 'modules'): _DIFF_OPTIONS,
+    ('diff', 'functions'): _DIFF_OPTIONS,
+    ('diff', 'symbols'): _DIFF_OPTIONS,
+    ('diff', 'all'): _DIFF_OPTIONS,
+    ('export', 'columnar'): [
+        (['--file'], dict(required=True, metavar='FILE',
+                          help='Binary file to write'))
+    ],
+    ('lookup', 'addresses'): [
+        (['-f', '--file'], dict(dest='address_file', metavar='FILE',
+                                help='File of the hexadecimal addresses to '
+                                     'look up, standard input by default'))
+    ]
+}
+
+# Destinations of the arguments which are not command options
+_MAIN_ARGS = ('p', 'command', 'subcommand', 'i', 'o', 'input_mode', 'cache',
+              'timings', 'profile', 'profile_json', 'jobs', 'watch')
+
 
 def make_argparser():
     argparser = argparse.ArgumentParser(prog='mapography')
@@ -36,19 +110,112 @@ def make_argparser():
 
     for command in COMMANDS.keys():
         argparser_calls = subargparsers.add_parser(command)
-        argparser_calls.add_argument(
-            'subcommand',
-            choices=COMMANDS[command],
+        subcommand_argparsers = argparser_calls.add_subparsers(
+            dest='subcommand',
             help='Command to execute. Available subcommands are: {}'
             .format(', '.join(COMMANDS[command])),
             metavar='subcommand')
+        for subcommand in COMMANDS[command]:
+            argparser_subcommand = subcommand_argparsers.add_parser(subcommand)
+            for flags, kwargs in OPTIONS.get((command, subcommand), []):
+                argparser_subcommand.add_argument(*flags, **kwargs)
 
     argparser.add_argument('i', help='Input file', metavar='input_file')
     argparser.add_argument('-o', help='Output file', metavar='output_file')
+    argparser.add_argument(
+        '--input-mode',
+        choices=reader.INPUT_MODES,
+        default=reader.AUTO,
+        help='How the input file is read: memory mapped, streamed line by '
+             'line or read at once. By default the compressed files (gzip, '
+             'bzip2, xz, zstd) are streamed and decompressed on the fly, the '
+             'others are memory mapped.')
+    argparser.add_argument(
+        '--cache',
+        nargs='?',
+        const=cache.DEFAULT_DIRECTORY,
+        help='Reuse the parsing results of previous runs on the same file '
+             'content, stored in CACHE_DIR (default {})'
+             .format(cache.DEFAULT_DIRECTORY),
+        metavar='CACHE_DIR')
+    argparser.add_argument(
+        '--jobs',
+        nargs='?',
+        type=int,
+        const=0,
+        help='Parse the sections of the map in parallel in N worker '
+             'processes (default: number of CPUs). Compressed files and the '
+             'stream input mode are parsed sequentially.',
+        metavar='N')
+    argparser.add_argument(
+        '--watch',
+        nargs='?',
+        type=float,
+        const=1.0,
+        help='Run the command again each time the input file changes, '
+             'checked every SECONDS (default 1), and print the changes of '
+             'its output. Only the changed sections are parsed again.',
+        metavar='SECONDS')
+    argparser.add_argument(
+        '--timings',
+        action='store_true',
+        help='Report the wall time and number of calls of each stage on the '
+             'standard error')
+    argparser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Like --timings, with the peak memory of each stage, which slows '
+             'down the run')
+    argparser.add_argument(
+        '--profile-json',
+        help='Write the measures of --timings or --profile to FILE as JSON '
+             'instead',
+        metavar='FILE')
 
     return argparser
 
 
+def parse_args(arguments):
+    """
+    Parse a command line which can give several commands to run on the same
+    map file, e.g. 'cosmic calls longest modules sizes map.map'. Each command
+    is parsed as a command line of its own, with the main arguments of the
+    whole line.
+    :param arguments: command line arguments, without the program name
+    :return: list of argparse namespaces, one per command
+    """
+    argparser = make_argparser()
+    starts = [n for n in range(len(arguments) - 1)
+              if arguments[n] in COMMANDS and
+              arguments[n + 1] in COMMANDS[arguments[n]]]
+    if len(starts) <= 1:
+        return [_check_args(argparser, argparser.parse_args(arguments))]
+
+    # The input file and the main options after it come with the last command
+    prefix = arguments[:starts[0]]
+    last = _check_args(argparser,
+                       argparser.parse_args(prefix + arguments[starts[-1]:]))
+    args_list = []
+    for start, end in zip(starts, starts[1:]):
+        args = argparser.parse_args(prefix + arguments[start:end] + [last.i])
+        for name in _MAIN_ARGS:
+            if name not in ('command', 'subcommand'):
+                setattr(args, name, getattr(last, name))
+        args_list.append(args)
+    return args_list + [last]
+
+
+def _check_args(argparser, args):
+    """ Exit with an argparse error if the main arguments conflict """
+    # The watch mode parses the new contents of the map incrementally
+    if args.watch is not None and (args.jobs is not None or
+                                   args.cache is not None or
+                                   args.input_mode != reader.AUTO):
+        argparser.error('--watch cannot be combined with --jobs, --cache or '
+                        '--input-mode')
+    return args
+
+
 def test_argparse():
     argtests = [
         # 'mapography -h'.split(),
@@ -69,20 +236,130 @@ def test_argparse():
         execute(args)
 
 
-def execute(args):
+def execute(args, *more_args):
+    """
+    :param args: argparse namespace of the command line
+    :param more_args: namespaces of the next commands of the command line
+    (see parse_args), run on the same parsing of the map
+    """
+    profiler = None
+    if args.timings or args.profile or args.profile_json is not None:
+        profiler = profiling.Profiler(memory=args.profile)
+
+    with profiler if profiler is not None else contextlib.nullcontext():
+        _execute([args] + list(more_args))
+
+    if profiler is not None:
+        if args.profile_json is not None:
+            with open(args.profile_json, 'w') as f:
+                f.write(profiler.json())
+        else:
+            sys.stderr.write(profiler.report() + '\n')
+
+
+def _execute(args_list):
+    args = args_list[0]
     mapparser = PARSERS[args.p]
+    if args.watch is not None:
+        if len(args_list) == 1:
+            watch.run(args, mapparser, _command(args), _options(args))
+        else:
+            watch.run(args, mapparser, _commands(args_list), {})
+        return
 
-    with open(args.i) as i:
-        maptext = i.read()
+    with contextlib.ExitStack() as stack:
+        # The workers read the map file themselves: each would decompress a
+        # compressed file, and a stream is asked to be read in a single pass
+        if args.jobs is not None and args.input_mode != reader.STREAM and \
+                reader.compression(args.i) is None:
+            mapparser = stack.enter_context(parallel.ParallelParser(
+                mapparser, args.i, args.jobs or None))
+        if args.cache is not None:
+            mapparser = cache.CachedParser(mapparser, args.i,
+                                           cache.MapCache(args.cache))
+        _run(args_list, mapparser)
 
-    func = getattr(commands.commands[args.command], args.subcommand)
-    result = func(maptext, mapparser)
 
-    if args.o is not None:
-        with open(args.o, 'w') as o:
-            o.write(result)
-    else:
-        print(result)
+def _command(args):
+    return getattr(commands.commands[args.command], args.subcommand)
+
+
+def _options(args):
+    """ Keyword arguments of the command function """
+    return {key: value for key, value in vars(args).items()
+            if key not in _MAIN_ARGS and value is not None}
+
+
+def _header(args):
+    """ Line preceding the output of a command, when there are several """
+    return '[{} {}]'.format(args.command, args.subcommand)
+
+
+def _commands(args_list):
+    """
+    Command function running several commands one after the other, the
+    output of each preceded by its header
+    """
+    def run(maptext, parser):
+        for n, args in enumerate(args_list):
+            if n:
+                yield ''
+            yield _header(args)
+            result = _command(args)(maptext, parser, **_options(args))
+            if isinstance(result, str):
+                result = result.split('\n')
+            for line in result:
+                yield line
+    return run
+
+
+def _run(args_list, mapparser):
+    args = args_list[0]
+    several = len(args_list) > 1
+
+    # A stream can only be read once in the order of the file, the commands
+    # may need the sections in another order
+    input_mode = args.input_mode
+    if input_mode in (reader.STREAM, reader.AUTO) and several:
+        input_mode = reader.MMAP
+
+    with contextlib.ExitStack() as stack:
+        # All the commands share the sections parsed by the MapFile
+        map_file = stack.enter_context(mapfile.MapFile(args.i, mapparser,
+                                                       input_mode))
+        # The sections needed by the commands are parsed together, when the
+        # parser can
+        map_file.prefetch([getter for command_args in args_list
+                           for getter in commands.getters(
+                               command_args.command, command_args.subcommand)])
+        if args.o is not None:
+            o = stack.enter_context(open(args.o, 'w'))
+        else:
+            o = sys.stdout
+
+        for n, command_args in enumerate(args_list):
+            if several:
+                o.write('{}{}\n'.format('\n' if n else '',
+                                        _header(command_args)))
+            with profiling.stage('{} {}'.format(command_args.command,
+                                                command_args.subcommand)):
+                result = map_file.run(command_args.command,
+                                      command_args.subcommand,
+                                      **_options(command_args))
+
+            # A command returns either a string or an iterable of lines, the
+            # lines are written as they are produced. The work of the lazy
+            # commands is done while writing, it is recorded as the output
+            # stage.
+            if isinstance(result, str):
+                o.write(result)
+                # A single string written to a file is not terminated
+                if args.o is None or several:
+                    o.write('\n')
+            else:
+                for line in profiling.profiled_iterator(result, 'output'):
+                    o.write(line + '\n')
+            o.flush()
 
 
 if __name__ == '__main__':
@@ -90,7 +367,7 @@ if __name__ == '__main__':
         args = make_argparser().print_help()
         sys.exit()
     else:
-        args = make_argparser().parse_args(sys.argv[1:])
+        args_list = parse_args(sys.argv[1:])
 
-    execute(args)
+    execute(*args_list)
 
@@ -0,0 +1,211 @@
+# coding: utf-8
+
+"""
+Batch mode: run commands on many map files, in parallel worker processes.
+Each file is parsed once for all the commands, and the results are reported
+in a single JSON document.
+
+Usage example:
+python -m mapography.batch cosmic -c "calls longest" -c "modules sizes" \
+    -c "calls function _main" "builds/**/*.map"
+"""
+
+import io
+import sys
+import glob
+import json
+import shlex
+import argparse
+import contextlib
+import concurrent.futures
+
+from mapography import reader, cache, mapfile
+from mapography.__main__ import PARSERS, COMMANDS, OPTIONS
+
+# Commands which can't run on many files: their output is a single file
+_UNSUPPORTED = [('export', 'columnar')]
+
+
+def expand_paths(patterns):
+    """ List the files matching the glob patterns, sorted, without doubles """
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        paths.update(matches if matches else [pattern])
+    return sorted(paths)
+
+
+def command_options(words):
+    """
+    Parse the options of a command, as on the mapography command line
+    :param words: command, subcommand and options
+    :return: keyword arguments of the command function
+    :raise ValueError: if the command or its options are invalid, or if the
+    command can't run in batch mode
+    """
+    if len(words) < 2 or words[1] not in COMMANDS.get(words[0], []):
+        raise ValueError("Unknown command '{}'".format(' '.join(words)))
+    command, subcommand = words[:2]
+    if (command, subcommand) in _UNSUPPORTED:
+        raise ValueError("'{} {}' can't run in batch mode".format(
+            command, subcommand))
+
+    argparser = argparse.ArgumentParser(
+        prog='{} {}'.format(command, subcommand), add_help=False)
+    for flags, kwargs in OPTIONS.get((command, subcommand), []):
+        argparser.add_argument(*flags, **kwargs)
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr):
+            args = argparser.parse_args(words[2:])
+    except SystemExit:
+        raise ValueError(stderr.getvalue().strip().splitlines()[-1])
+
+    options = {key: value for key, value in vars(args).items()
+               if value is not None}
+    # The workers have no standard input to read the addresses from
+    if (command, subcommand) == ('lookup', 'addresses') and \
+            'address_file' not in options:
+        raise ValueError("'lookup addresses' needs the -f option in batch "
+                         "mode")
+    return options
+
+
+def analyse(path, parser_name, command_list, input_mode=reader.MMAP,
+            cache_directory=None):
+    """
+    Run the commands on a map file, the file is parsed once
+    :param path: map file path
+    :param parser_name: key of PARSERS
+    :param command_list: list of commands, a command being a tuple of the
+    command, the subcommand and its options (see command_options)
+    :param input_mode: see reader.open_map
+    :param cache_directory: directory of the on-disk cache, not used if None
+    :return: dict with the keys 'path', 'results' (dict command text ->
+    command result string), 'errors' (dict command text -> error message of
+    the failed commands) and 'error' (error message if the file couldn't be
+    opened, or None)
+    """
+    report = {'path': path, 'results': {}, 'errors': {}, 'error': None}
+
+    try:
+        mapparser = PARSERS[parser_name]
+        if cache_directory is not None:
+            mapparser = cache.CachedParser(mapparser, path,
+                                           cache.MapCache(cache_directory))
+
+        with mapfile.MapFile(path, mapparser, input_mode) as map_file:
+            for words in command_list:
+                key = ' '.join(words)
+                # A failed command doesn't prevent running the next ones
+                try:
+                    result = map_file.run(words[0], words[1],
+                                          **command_options(list(words)))
+                    if not isinstance(result, str):
+                        result = '\n'.join(result)
+                except Exception as e:
+                    report['errors'][key] = '{}: {}'.format(
+                        e.__class__.__name__, e)
+                else:
+                    report['results'][key] = result
+    except Exception as e:
+        report['error'] = '{}: {}'.format(e.__class__.__name__, e)
+
+    return report
+
+
+def run_batch(paths, parser_name, command_list, jobs=None,
+              input_mode=reader.MMAP, cache_directory=None):
+    """
+    Analyse the map files in a pool of worker processes, see analyse
+    :param jobs: number of worker processes, number of CPUs if None
+    :return: generator of the reports of each file, in the order of paths
+    """
+    # Streams can't be read more than once, which running several commands
+    # may need
+    if input_mode in (reader.STREAM, reader.AUTO) and len(command_list) > 1:
+        input_mode = reader.MMAP
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(analyse, path, parser_name, command_list,
+                                   input_mode, cache_directory)
+                   for path in paths]
+        for future in futures:
+            yield future.result()
+
+
+def parse_command(text):
+    """
+    'command subcommand [options]' -> tuple of the words, for argparse. The
+    options are checked, see command_options.
+    """
+    words = tuple(shlex.split(text))
+    try:
+        command_options(list(words))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return words
+
+
+def make_argparser():
+    argparser = argparse.ArgumentParser(prog='mapography.batch')
+
+    argparser.add_argument(
+        'p',
+        choices=PARSERS.keys(),
+        help='Available parsers: {}'.format(', '.join(PARSERS.keys())),
+        metavar='parser')
+    argparser.add_argument(
+        'i',
+        nargs='+',
+        help='Input files or glob patterns',
+        metavar='input_file')
+    argparser.add_argument(
+        '-c',
+        action='append',
+        type=parse_command,
+        required=True,
+        help="Command to run on each file, as 'command subcommand' followed "
+             "by its options. Can be given several times.",
+        metavar='command')
+    argparser.add_argument(
+        '-j',
+        type=int,
+        help='Number of worker processes, number of CPUs by default',
+        metavar='jobs')
+    argparser.add_argument('-o', help='Output file', metavar='output_file')
+    argparser.add_argument(
+        '--input-mode',
+        choices=reader.INPUT_MODES,
+        default=reader.AUTO,
+        help='How the input files are read, see mapography -h')
+    argparser.add_argument(
+        '--cache',
+        nargs='?',
+        const=cache.DEFAULT_DIRECTORY,
+        help='Use the on-disk cache of parsing results, see mapography -h',
+        metavar='CACHE_DIR')
+
+    return argparser
+
+
+def execute(args):
+    reports = run_batch(expand_paths(args.i), args.p, args.c, args.j,
+                        args.input_mode, args.cache)
+    report = {'parser': args.p,
+              'commands': [' '.join(command) for command in args.c],
+              'files': list(reports)}
+
+    if args.o is not None:
+        with open(args.o, 'w') as o:
+            json.dump(report, o, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    return 1 if any(r['error'] is not None or r['errors']
+                    for r in report['files']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(execute(make_argparser().parse_args(sys.argv[1:])))
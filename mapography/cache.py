@@ -0,0 +1,167 @@
+# coding: utf-8
+
+import os
+import zlib
+import pickle
+import hashlib
+import tempfile
+
+from mapography import profiling
+
+DEFAULT_DIRECTORY = os.environ.get(
+    'MAPOGRAPHY_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'mapography'))
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024  # bytes
+
+_SUFFIX = '.pickle.z'
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """ SHA-256 hex digest of the content of a file, read by chunks """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MapCache(object):
+    """
+    On-disk cache of parsed objects, one zlib-compressed pickle file per key.
+    The least recently used entries are evicted when the total size exceeds
+    max_size.
+    """
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        self.directory = DEFAULT_DIRECTORY if directory is None else directory
+        self.max_size = max_size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """ Return the object stored for key, None if not in the cache """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+
+        try:
+            value = pickle.loads(zlib.decompress(data))
+        except Exception:
+            # Corrupted or incompatible entry, parse again
+            return None
+
+        try:
+            os.utime(path, None)  # most recently used
+        except FileNotFoundError:
+            pass  # evicted meanwhile by another process
+        return value
+
+    def put(self, key, value):
+        """ Store value for key, then evict entries if the cache is full """
+        os.makedirs(self.directory, exist_ok=True)
+
+        data = zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+        # Written aside then renamed so that readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries exceeding max_size. Several
+        processes can share the directory: the entries removed by the others
+        meanwhile are skipped.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_SUFFIX):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total_size = sum(entry[1] for entry in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass  # already evicted
+            total_size -= size
+
+
+class MemoryCache(object):
+    """ In-memory cache with the same interface as MapCache, not bounded """
+    def __init__(self):
+        self.values = {}
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def put(self, key, value):
+        self.values[key] = value
+
+
+class CachedParser(object):
+    """
+    Wrapper of a parser module for one map file, whose get_* functions return
+    the cached objects when the file content and the parser version are
+    unchanged. It can be given to the commands in place of the parser.
+    """
+
+    # Functions of the parsers whose results are cached
+    CACHED = ('get_segments', 'get_modules', 'get_call_tree',
+              'get_symbols')
+
+    def __init__(self, parser, path, cache=None):
+        self.parser = parser
+        self.cache = MapCache() if cache is None else cache
+        with profiling.stage('cache hash'):
+            content_hash = file_hash(path)
+        self.key = '{}-{}-{}'.format(
+            content_hash, parser.__name__.rsplit('.', 1)[-1],
+            parser.PARSER_VERSION)
+
+    def _key(self, name):
+        return '{}-{}'.format(self.key, name)
+
+    def _get(self, name, maptext, index=None):
+        key = self._key(name)
+        with profiling.stage('cache load'):
+            value = self.cache.get(key)
+        if value is None:
+            value = getattr(self.parser, name)(maptext, index)
+            with profiling.stage('cache store'):
+                self.cache.put(key, value)
+        return value
+
+    def prefetch(self, getters):
+        """
+        Let the wrapped parser parse together the sections of the getters
+        which are not in the cache, if it can (see ParallelParser.prefetch)
+        """
+        prefetch = getattr(self.parser, 'prefetch', None)
+        if prefetch is not None:
+            prefetch([name for name in getters
+                      if self._key(name) not in self.cache])
+
+    def __getattr__(self, name):
+        if name in self.CACHED:
+            return lambda maptext, index=None: self._get(name, maptext, index)
+        return getattr(self.parser, name)
@@ -1,9 +1,42 @@
 # coding: utf-8
 
-from . import calls, modules
+from . import calls, modules, lookup, symbols, diff, export
 
 
 commands = {
     'calls': calls,
-    'modules': modules
+    'modules': modules,
+    'lookup': lookup,
+    'symbols': symbols,
+    'diff': diff,
+    'export': export
 }
+
+
+_ALL_GETTERS = ['get_segments', 'get_modules', 'get_call_tree', 'get_symbols']
+
+# Parser getters each command calls on the map, so that the sections can be
+# parsed together beforehand: command -> getters, or dict subcommand ->
+# getters
+GETTERS = {
+    'calls': ['get_call_tree'],
+    'modules': ['get_modules'],
+    'lookup': ['get_segments', 'get_modules', 'get_symbols'],
+    'symbols': ['get_symbols'],
+    'diff': {
+        'sections': ['get_segments'],
+        'modules': ['get_modules'],
+        'functions': ['get_call_tree'],
+        'symbols': ['get_symbols'],
+        'all': _ALL_GETTERS
+    },
+    'export': _ALL_GETTERS
+}
+
+
+def getters(command, subcommand):
+    """ Names of the parser getters the command calls on the map """
+    command_getters = GETTERS[command]
+    if isinstance(command_getters, dict):
+        command_getters = command_getters[subcommand]
+    return command_getters
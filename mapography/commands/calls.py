@@ -1,16 +1,76 @@
 # coding: utf-8
 
 
-def tree(maptext, parser):
-    return str(parser.get_call_tree(maptext).draw_call_tree())
+def tree(maptext, parser, max_depth=None, collapse=False):
+    return parser.get_call_tree(maptext).draw_lines(max_depth, collapse)
 
 
-def paths(maptext, parser):
+def paths(maptext, parser, max_depth=None, min_stack=None, top=None):
     call_tree = parser.get_call_tree(maptext)
-    return '\n'.join([str(path) for path in call_tree.call_paths()])
+    return (str(path)
+            for path in call_tree.call_paths(max_depth, min_stack, top))
 
 
 def longest(maptext, parser):
     return str(parser.get_call_tree(maptext).longest_path())
 
 
+def cycles(maptext, parser):
+    call_tree = parser.get_call_tree(maptext)
+    return '\n'.join([', '.join(cycle)
+                      for cycle in call_tree.recursive_cycles()])
+
+
+def _format_path(path):
+    return ' -> '.join(['{} ({})'.format(name, size) for name, size in path])
+
+
+def callers(maptext, parser, name, transitive=False):
+    call_tree = parser.get_call_tree(maptext)
+    if name not in call_tree.functions:
+        return '{}: unknown function'.format(name)
+    if not transitive:
+        return '\n'.join(call_tree.callers(name)) or '-'
+
+    # Breadth first walk of the callers, nearest first
+    found = {name}
+    level = [name]
+    lines = []
+    while level:
+        next_level = []
+        for function in level:
+            for caller in call_tree.callers(function):
+                if caller not in found:
+                    found.add(caller)
+                    next_level.append(caller)
+        lines.extend(sorted(next_level))
+        level = next_level
+    return '\n'.join(lines) or '-'
+
+
+def function(maptext, parser, name):
+    call_tree = parser.get_call_tree(maptext)
+    if name not in call_tree.functions:
+        return '{}: unknown function'.format(name)
+
+    size = call_tree.functions[name]['size']
+    inclusive = call_tree.stack_usage()[name][0]
+    below = call_tree.heaviest_path(name)
+    entry, above = call_tree.entry_depth(name)
+
+    lines = ['{} ({})'.format(name, size),
+             'worst stack below: {} ({})'.format(inclusive,
+                                                 _format_path(below))]
+    if entry is None:
+        lines.append('worst stack at entry: not called from a root')
+    else:
+        lines.append('worst stack at entry: {} ({})'.format(
+            entry, _format_path(above[:-1]) if len(above) > 1 else 'root'))
+        lines.append('worst stack through: {}'.format(entry + inclusive))
+    lines.append('called by: {}'.format(
+        ', '.join(call_tree.callers(name)) or '-'))
+    lines.append('calls: {}'.format(
+        ', '.join(sorted(call_tree.functions[name]['calls'])) or '-'))
+    lines.append('roots: {}'.format(
+        ', '.join(call_tree.reaching_roots(name)) or '-'))
+    return '\n'.join(lines)
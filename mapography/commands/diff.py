@@ -0,0 +1,93 @@
+# coding: utf-8
+
+from mapography import diff
+
+
+def _format_deltas(deltas, key_format='{}'):
+    lines = []
+    for key, old, new, delta in deltas:
+        name = key_format.format(*key) if isinstance(key, tuple) \
+            else key_format.format(key)
+        if old is None:
+            lines.append('{}: added ({})'.format(name, new))
+        elif new is None:
+            lines.append('{}: removed ({})'.format(name, old))
+        else:
+            lines.append('{}: {} -> {} ({:+d})'.format(name, old, new, delta))
+    return '\n'.join(lines)
+
+
+def _sections(base_segments, segments):
+    return _format_deltas(diff.diff_values(diff.section_sizes(base_segments),
+                                           diff.section_sizes(segments)))
+
+
+def _modules(base_modules, modules):
+    return _format_deltas(diff.diff_values(diff.module_sizes(base_modules),
+                                           diff.module_sizes(modules)),
+                          '{} ({})')
+
+
+def _functions(base_call_tree, call_tree):
+    base_longest = base_call_tree.longest_path()[0]
+    longest = call_tree.longest_path()[0]
+    header = 'worst case stack: {} -> {} ({:+d})'.format(
+        base_longest, longest, longest - base_longest)
+    deltas = diff.diff_values(diff.function_stacks(base_call_tree),
+                              diff.function_stacks(call_tree))
+    return '{}\n{}'.format(header, _format_deltas(deltas)).rstrip('\n')
+
+
+def _symbols(base_symbols, symbols):
+    base_addresses = diff.symbol_addresses(base_symbols)
+    addresses = diff.symbol_addresses(symbols)
+
+    lines = []
+    for name in sorted(set(base_addresses) | set(addresses)):
+        old, new = base_addresses.get(name), addresses.get(name)
+        if old is None:
+            lines.append('{}: added ({:#x})'.format(name, new))
+        elif new is None:
+            lines.append('{}: removed ({:#x})'.format(name, old))
+        elif old != new:
+            lines.append('{}: moved {:#x} -> {:#x}'.format(name, old, new))
+    return '\n'.join(lines)
+
+
+def sections(maptext, parser, base, parallel=True):
+    (base_segments,), (segments,) = diff.parse_maps(
+        parser, maptext, base, ['get_segments'], parallel)
+    return _sections(base_segments, segments)
+
+
+def modules(maptext, parser, base, parallel=True):
+    (base_modules,), (modules,) = diff.parse_maps(
+        parser, maptext, base, ['get_modules'], parallel)
+    return _modules(base_modules, modules)
+
+
+def functions(maptext, parser, base, parallel=True):
+    (base_call_tree,), (call_tree,) = diff.parse_maps(
+        parser, maptext, base, ['get_call_tree'], parallel)
+    return _functions(base_call_tree, call_tree)
+
+
+def symbols(maptext, parser, base, parallel=True):
+    (base_symbols,), (symbols,) = diff.parse_maps(
+        parser, maptext, base, ['get_symbols'], parallel)
+    return _symbols(base_symbols, symbols)
+
+
+def all(maptext, parser, base, parallel=True):
+    base_results, results = diff.parse_maps(
+        parser, maptext, base,
+        ['get_segments', 'get_modules', 'get_call_tree', 'get_symbols'],
+        parallel)
+
+    blocs = []
+    for title, func, base_result, result in zip(
+            ['Sections', 'Modules', 'Functions', 'Symbols'],
+            [_sections, _modules, _functions, _symbols],
+            base_results, results):
+        blocs.append('{}:\n{}'.format(title, func(base_result, result)))
+    return '\n\n'.join(blocs)
@@ -0,0 +1,14 @@
+# coding: utf-8
+
+from mapography import export
+
+
+def jsonl(maptext, parser):
+    return export.iter_jsonl(maptext, parser)
+
+
+def columnar(maptext, parser, file):
+    with open(file, 'wb') as f:
+        rows = export.write_columnar(maptext, parser, f)
+    return '\n'.join(['{}: {} rows'.format(name, count)
+                      for name, count in rows.items()])
@@ -0,0 +1,68 @@
+# coding: utf-8
+
+import re
+import sys
+
+from mapography.model import AddressIndex
+
+
+def _tokens(lines):
+    """ Addresses in lines, separated by blanks, commas or semicolons """
+    for line in lines:
+        for token in re.split(r'[\s,;]+', line):
+            if token:
+                yield token
+
+
+def _format(result):
+    infos = ['segment {}'.format(segment.name)
+             for segment in result['segments']]
+    infos += ['module {} ({})'.format(module.name, name)
+              for name, module in result['modules']]
+    if result['symbol'] is not None:
+        symbol, offset = result['symbol']
+        infos.append('symbol {}+{:#x}'.format(symbol.name, offset))
+
+    return '{:#x}: {}'.format(result['address'],
+                              ', '.join(infos) if infos else 'not found')
+
+
+def addresses(maptext, parser, address_file=None, address_text=None):
+    """
+    :param address_file: file of the addresses, standard input if None and
+    if address_text is None
+    :param address_text: addresses as a string, instead of a file
+    """
+    # A MapFile memoizes the index for the lookups of the next commands
+    get_index = getattr(parser, 'get_address_index', None)
+    if get_index is not None:
+        index = get_index(maptext)
+    else:
+        index = AddressIndex(segments=parser.get_segments(maptext),
+                             modules=parser.get_modules(maptext),
+                             symbols=parser.get_symbols(maptext).symbols)
+
+    if address_text is not None:
+        tokens = list(_tokens(address_text.splitlines()))
+    elif address_file is None:
+        tokens = list(_tokens(sys.stdin))
+    else:
+        with open(address_file) as f:
+            tokens = list(_tokens(f))
+
+    # Addresses of the valid tokens, looked up together
+    addresses = []
+    for token in tokens:
+        try:
+            addresses.append(int(token, 16))
+        except ValueError:
+            addresses.append(None)
+    results = iter(index.lookup_many([address for address in addresses
+                                      if address is not None and
+                                      address >= 0]))
+
+    for token, address in zip(tokens, addresses):
+        if address is None or address < 0:
+            yield '{}: invalid address'.format(token)
+        else:
+            yield _format(next(results))
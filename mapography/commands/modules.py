@@ -1,38 +1,67 @@
 # coding: utf-8
 
+import re
+
 
 def list(maptext, parser):
     return '\n\n'.join(str(m) for m in parser.get_modules(maptext))
 
 
-def sizes(maptext, parser):
-    modules = parser.get_modules(maptext)
+def _directory(module_name, depth):
+    """ First depth directories of the module path, '.' if it has none """
+    separators = [m.start() for m in re.finditer(r'[\\/]', module_name)]
+    if not separators or depth < 1:
+        return '.'
+    return module_name[:separators[min(depth, len(separators)) - 1]]
 
-    # Find section names
-    secnames = set(seg.name for m in modules for seg in m.segments)
 
-    # Find and regroup the modules by section type, sorted
-    sizes = []
-    for secname in secnames:
-        section = {'name': secname, 'modules': []}
-        for m in modules:
-            for seg in m.segments:
-                if seg.name == secname:
-                    section['modules'].append((m.name, len(seg)))
-                    break
-        section['modules'].sort(key=lambda m: m[1], reverse=True)
-        sizes.append(section)
+def aggregate_sizes(modules, rollup=None):
+    """
+    Sum the lengths of the segments per section and per module in a single
+    pass over the segments
+    :param modules: list of Module objects
+    :param rollup: if not None, the modules are grouped by their first rollup
+    directories
+    :return: dict section name -> dict module (or directory) name -> size,
+    the modules in their order in the list
+    """
+    sizes = {}
+    for module in modules:
+        if rollup is None:
+            name = module.name
+        else:
+            name = _directory(module.name, rollup)
+        for seg in module.segments:
+            section = sizes.get(seg.name)
+            if section is None:
+                section = sizes[seg.name] = {}
+            section[name] = section.get(name, 0) + len(seg)
+    return sizes
+
+
+def sizes(maptext, parser, totals=False, percent=False, rollup=None):
+    sizes = aggregate_sizes(parser.get_modules(maptext), rollup)
+
     # the complicated lambda is for putting names starting with '.' at the end
-    sizes.sort(key=lambda s: ['1', '0'][s['name'][0].isalpha()] + s['name'])
+    secnames = sorted(sizes, key=lambda s: ['1', '0'][s[0].isalpha()] + s)
 
     # Formatting
     results = []
-    for section in sizes:
-        module_list = '\n'.join(['{} ({})'.format(*m)
-                                 for m in section['modules']])
-        bloc = '{}:\n{}'.format(section['name'], module_list)
-        results.append(bloc)
+    for secname in secnames:
+        section = sizes[secname]
+        total = sum(section.values())
 
-    return '\n\n'.join(results)
+        lines = []
+        for name, size in sorted(section.items(), key=lambda m: m[1],
+                                 reverse=True):
+            if percent:
+                lines.append('{} ({}, {:.1f}%)'.format(
+                    name, size, 100.0 * size / total if total else 0.0))
+            else:
+                lines.append('{} ({})'.format(name, size))
+        if totals:
+            lines.append('total ({})'.format(total))
 
+        results.append('{}:\n{}'.format(secname, '\n'.join(lines)))
 
+    return '\n\n'.join(results)
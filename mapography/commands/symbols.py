@@ -0,0 +1,23 @@
+# coding: utf-8
+
+
+def list(maptext, parser):
+    return (str(symbol) for symbol in parser.get_symbols(maptext))
+
+
+def unused(maptext, parser):
+    return (str(symbol) for symbol in parser.get_symbols(maptext).unused())
+
+
+def uses(maptext, parser, module=None):
+    symbols = parser.get_symbols(maptext)
+    modules = sorted(symbols.used_in) if module is None else [module]
+
+    results = []
+    for name in modules:
+        used = sorted(symbols.symbols_used_by(name), key=lambda s: s.name)
+        lines = ['{} ({})'.format(symbol.name, symbol.module)
+                 for symbol in used]
+        results.append('{}:\n{}'.format(name, '\n'.join(lines)))
+
+    return '\n\n'.join(results)
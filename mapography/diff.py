@@ -0,0 +1,95 @@
+# coding: utf-8
+
+"""
+Comparison of the parsed objects of two map files. The objects are reduced
+to dictionaries name -> size, joined by name.
+"""
+
+import importlib
+import concurrent.futures
+
+from mapography import reader
+from mapography.commands.modules import aggregate_sizes
+
+
+def parse_map(parser_name, path, getters, input_mode=reader.MMAP):
+    """
+    Parse a map file, can run in a worker process
+    :param parser_name: name of the parser module, e.g.
+    'mapography.parser.cosmic'
+    :param path: map file path
+    :param getters: names of the parser functions to call, e.g.
+    ['get_modules', 'get_call_tree'], in the order of the sections in the file
+    :param input_mode: see reader.open_map
+    :return: list of the results of the getters
+    """
+    parser = importlib.import_module(parser_name)
+    with reader.open_map(path, input_mode) as maptext:
+        return [getattr(parser, getter)(maptext) for getter in getters]
+
+
+def parse_maps(parser, maptext, base_path, getters, parallel=True):
+    """
+    Parse the map content with the parser and the base map file with the same
+    parser module. The base map is parsed in a worker process meanwhile,
+    unless parallel is False.
+    :return: (base results, results), see parse_map
+    """
+    if not parallel:
+        base = parse_map(parser.__name__, base_path, getters)
+        return base, [getattr(parser, getter)(maptext) for getter in getters]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(parse_map, parser.__name__, base_path,
+                                 getters)
+        results = [getattr(parser, getter)(maptext) for getter in getters]
+        return future.result(), results
+
+
+def section_sizes(segments):
+    """ Dictionary segment name -> total length """
+    sizes = {}
+    for segment in segments:
+        sizes[segment.name] = sizes.get(segment.name, 0) + len(segment)
+    return sizes
+
+
+def module_sizes(modules):
+    """ Dictionary (module name, section name) -> total length """
+    return {(module, section): size
+            for section, section_modules in aggregate_sizes(modules).items()
+            for module, size in section_modules.items()}
+
+
+def function_stacks(call_tree):
+    """ Dictionary function name -> worst case stack usage including calls """
+    return {name: usage[0] for name, usage in call_tree.stack_usage().items()}
+
+
+def symbol_addresses(symbols):
+    """ Dictionary symbol name -> address """
+    return {symbol.name: symbol.address for symbol in symbols}
+
+
+def diff_values(old, new):
+    """
+    Join two dictionaries by key and compute the deltas of the values
+    :param old: dictionary key -> number
+    :param new: dictionary key -> number
+    :return: list of (key, old value, new value, delta) of the keys whose
+    value differs, old or new value being None for added or removed keys,
+    sorted by decreasing absolute delta then by key
+    """
+    deltas = []
+    for key, old_value in old.items():
+        new_value = new.get(key)
+        if new_value != old_value:
+            delta = (0 if new_value is None else new_value) - old_value
+            deltas.append((key, old_value, new_value, delta))
+
+    for key, new_value in new.items():
+        if key not in old:
+            deltas.append((key, None, new_value, new_value))
+
+    deltas.sort(key=lambda d: (-abs(d[3]), d[0]))
+    return deltas
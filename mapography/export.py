@@ -0,0 +1,290 @@
+# coding: utf-8
+
+"""
+Export of the parsed model for other tools, as JSON Lines or in a binary
+columnar format. The sections are parsed and written one after the other, so
+the output grows as the map is parsed.
+
+JSON Lines: a header record then one record per segment, module, function
+and symbol, each with a 'type' key.
+
+Columnar format, all integers little-endian:
+    - MAGIC
+    - tables, one per section: table name, number of columns, columns
+    - string table: number of strings, array of the end offsets of the
+    strings in the blob (int64), UTF-8 blob
+    - trailer: offset of the string table (uint64), MAGIC
+A column is its name, a type code, its number of values and the values as an
+int64 array. The values of the STRING columns are indexes in the string
+table, -1 for None. The lists (segments of a module, calls of a function...)
+are stored as an offsets column, the values of row n being at
+offsets[n]:offsets[n + 1] of the values column.
+"""
+
+import sys
+import json
+import array
+import struct
+
+FORMAT_VERSION = 1
+
+MAGIC = b'MAPOCOL1'
+
+# Column types
+INTEGER = b'q'
+STRING = b's'
+
+_TRAILER = struct.Struct('<Q8s')
+
+
+def _length_prefixed(text):
+    data = text.encode('utf-8')
+    return struct.pack('<H', len(data)) + data
+
+
+def _int64_bytes(values):
+    values = array.array('q', values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+class ColumnarWriter(object):
+    """
+    Writes tables of columns to a binary file object, as they are given.
+    The strings of all the tables are collected in a single string table,
+    written by close.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.strings = {}
+        self.f.write(MAGIC)
+        self.position = len(MAGIC)
+
+    def _write(self, data):
+        self.f.write(data)
+        self.position += len(data)
+
+    def string_id(self, text):
+        if text is None:
+            return -1
+        string_id = self.strings.get(text)
+        if string_id is None:
+            string_id = self.strings[text] = len(self.strings)
+        return string_id
+
+    def write_table(self, name, columns):
+        """
+        :param name: table name
+        :param columns: list of (column name, column type, list of values)
+        """
+        self._write(_length_prefixed(name) +
+                    struct.pack('<H', len(columns)))
+        for column_name, column_type, values in columns:
+            if column_type == STRING:
+                values = [self.string_id(value) for value in values]
+            self._write(_length_prefixed(column_name) + column_type +
+                        struct.pack('<Q', len(values)) + _int64_bytes(values))
+
+    def close(self):
+        """ Write the string table and the trailer """
+        strings_position = self.position
+        blobs = [text.encode('utf-8') for text in self.strings]
+        ends = []
+        end = 0
+        for blob in blobs:
+            end += len(blob)
+            ends.append(end)
+        self._write(struct.pack('<Q', len(blobs)) + _int64_bytes(ends))
+        self._write(b''.join(blobs))
+        self._write(_TRAILER.pack(strings_position, MAGIC))
+
+
+def _read_int64(data, position, count):
+    values = array.array('q')
+    values.frombytes(data[position:position + 8 * count])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values, position + 8 * count
+
+
+def _read_text(data, position):
+    length, = struct.unpack_from('<H', data, position)
+    position += 2
+    return data[position:position + length].decode('utf-8'), \
+        position + length
+
+
+def load_columnar(path):
+    """
+    Load a file written in the columnar format
+    :return: dict table name -> dict column name -> values, an array of
+    integers or a list of strings (None for the missing ones)
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if data[:len(MAGIC)] != MAGIC or \
+            data[-_TRAILER.size:][-len(MAGIC):] != MAGIC:
+        raise ValueError("'{}' is not a columnar export".format(path))
+    strings_position, _ = _TRAILER.unpack_from(data,
+                                               len(data) - _TRAILER.size)
+
+    count, = struct.unpack_from('<Q', data, strings_position)
+    ends, position = _read_int64(data, strings_position + 8, count)
+    strings = []
+    start = position
+    for end in ends:
+        strings.append(data[start:position + end].decode('utf-8'))
+        start = position + end
+
+    tables = {}
+    position = len(MAGIC)
+    while position < strings_position:
+        table_name, position = _read_text(data, position)
+        column_count, = struct.unpack_from('<H', data, position)
+        position += 2
+        table = tables[table_name] = {}
+        for _ in range(column_count):
+            column_name, position = _read_text(data, position)
+            column_type = data[position:position + 1]
+            count, = struct.unpack_from('<Q', data, position + 1)
+            values, position = _read_int64(data, position + 9, count)
+            if column_type == STRING:
+                values = [None if n < 0 else strings[n] for n in values]
+            table[column_name] = values
+    return tables
+
+
+def _flatten(lists):
+    """ List of lists -> (offsets, values) """
+    offsets = [0]
+    values = []
+    for items in lists:
+        values.extend(items)
+        offsets.append(len(values))
+    return offsets, values
+
+
+def segment_columns(segments):
+    return [('name', STRING, [segment.name for segment in segments]),
+            ('start', INTEGER, [segment.start for segment in segments]),
+            ('end', INTEGER, [segment.end for segment in segments])]
+
+
+def module_columns(modules):
+    offsets, segments = _flatten([module.segments for module in modules])
+    return [('name', STRING, [module.name for module in modules]),
+            ('segment_offsets', INTEGER, offsets)] + \
+        [('segment_' + name, column_type, values)
+         for name, column_type, values in segment_columns(segments)]
+
+
+def function_columns(call_tree):
+    graph = call_tree.compact()
+    roots = set(graph.roots)
+    return [('name', STRING, graph.names),
+            ('size', INTEGER, graph.sizes),
+            ('root', INTEGER, [int(n in roots) for n in range(len(graph))]),
+            ('call_offsets', INTEGER, graph.offsets),
+            ('calls', INTEGER, graph.callees)]
+
+
+def symbol_columns(symbols):
+    offsets, used_in = _flatten([symbol.used_in for symbol in symbols])
+    return [('name', STRING, [symbol.name for symbol in symbols]),
+            ('address', INTEGER, [symbol.address for symbol in symbols]),
+            ('module', STRING, [symbol.module for symbol in symbols]),
+            ('section', STRING, [symbol.section for symbol in symbols]),
+            ('used_in_offsets', INTEGER, offsets),
+            ('used_in', STRING, used_in)]
+
+
+def _sections(maptext, parser):
+    """
+    Generator of (table name, parsed objects), each section being parsed
+    when the previous one is consumed. The missing sections are skipped.
+    """
+    getters = [('segments', 'get_segments'), ('modules', 'get_modules'),
+               ('functions', 'get_call_tree'), ('symbols', 'get_symbols')]
+
+    if not hasattr(maptext, 'find'):
+        # A stream is read in a single pass, the sections are parsed in the
+        # order of the file as their headers are met
+        names = {parser.GETTER_SECTIONS[getter]: name
+                 for name, getter in getters}
+        for title, lines in parser.stream_sections(maptext):
+            name = names.pop(title, None)
+            if name is not None:
+                yield name, parser.parse_lines(title, lines)
+        return
+
+    # A single scan of the map content locates all the sections
+    index = parser.index_sections(maptext)
+    for name, getter in getters:
+        try:
+            parsed = getattr(parser, getter)(maptext, index)
+        except parser.ParserError:
+            continue
+        yield name, parsed
+
+
+def write_columnar(maptext, parser, f):
+    """
+    Write the parsed map to a binary file object in the columnar format
+    :return: dict table name -> number of rows
+    """
+    makers = {'segments': segment_columns, 'modules': module_columns,
+              'functions': function_columns, 'symbols': symbol_columns}
+    writer = ColumnarWriter(f)
+    rows = {}
+    for name, parsed in _sections(maptext, parser):
+        columns = makers[name](parsed)
+        rows[name] = len(columns[0][2])
+        writer.write_table(name, columns)
+    writer.close()
+    return rows
+
+
+def iter_records(maptext, parser):
+    """
+    Generator of the records of the parsed map as dicts, each with a 'type'
+    key, starting with the header record
+    """
+    yield {'type': 'header', 'format': FORMAT_VERSION,
+           'parser': parser.__name__.rsplit('.', 1)[-1],
+           'parser_version': parser.PARSER_VERSION}
+
+    for name, parsed in _sections(maptext, parser):
+        if name == 'segments':
+            for segment in parsed:
+                yield {'type': 'segment', 'name': segment.name,
+                       'start': segment.start, 'end': segment.end}
+        elif name == 'modules':
+            for module in parsed:
+                yield {'type': 'module', 'name': module.name,
+                       'segments': [{'name': segment.name,
+                                     'start': segment.start,
+                                     'end': segment.end}
+                                    for segment in module.segments]}
+        elif name == 'functions':
+            for function_name in sorted(parsed.functions):
+                function = parsed.functions[function_name]
+                yield {'type': 'function', 'name': function_name,
+                       'size': function['size'],
+                       'root': function_name in parsed.roots,
+                       'calls': sorted(function['calls'])}
+        else:
+            for symbol in parsed:
+                yield {'type': 'symbol', 'name': symbol.name,
+                       'address': symbol.address, 'module': symbol.module,
+                       'section': symbol.section,
+                       'used_in': list(symbol.used_in)}
+
+
+def iter_jsonl(maptext, parser):
+    """ Generator of the JSON Lines of the parsed map, see iter_records """
+    encoder = json.JSONEncoder(separators=(',', ':'))
+    for record in iter_records(maptext, parser):
+        yield encoder.encode(record)
@@ -0,0 +1,253 @@
+# coding: utf-8
+
+"""
+Build history database: the parsed model of the map files of many builds is
+stored in a SQLite database, so that the evolution of the sizes and of the
+stack usage can be queried without the map files.
+
+Usage example:
+python -m mapography.history history.db ingest cosmic build42.map -b 42
+python -m mapography.history history.db trend --module src\\main.o -s vtext
+python -m mapography.history history.db first --function _main -t 200
+"""
+
+import sys
+import sqlite3
+import argparse
+
+from mapography import reader
+from mapography.parser.cosmic import ParserError
+from mapography.__main__ import PARSERS
+from mapography.commands.modules import aggregate_sizes
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    path TEXT,
+    max_stack INTEGER
+);
+CREATE TABLE IF NOT EXISTS segments (
+    build_id INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS module_sizes (
+    build_id INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE,
+    module TEXT NOT NULL,
+    section TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS function_stacks (
+    build_id INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE,
+    function TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    worst_stack INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_name ON segments (name, build_id);
+CREATE INDEX IF NOT EXISTS module_sizes_module
+    ON module_sizes (module, section, build_id);
+CREATE INDEX IF NOT EXISTS module_sizes_section
+    ON module_sizes (section, build_id);
+CREATE INDEX IF NOT EXISTS function_stacks_function
+    ON function_stacks (function, build_id);
+"""
+
+
+class History(object):
+    """
+    Database of the parsed map files of successive builds. The builds are
+    ordered by ingestion.
+    """
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def ingest(self, name, segments=None, modules=None, call_tree=None,
+               path=None):
+        """
+        Store the parsed objects of the map file of a build, replacing the
+        content of the build of the same name if any, which keeps its place
+        in the order of the builds
+        :param name: build name
+        :param segments: list of Segment objects
+        :param modules: list of Module objects
+        :param call_tree: CallTree object
+        :param path: map file path, for information
+        """
+        max_stack = None if call_tree is None else call_tree.longest_path()[0]
+
+        with self.connection:
+            # A build ingested again keeps its id, thus its place in the
+            # history, only its content is replaced
+            row = self.connection.execute(
+                "SELECT id FROM builds WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                build_id = self.connection.execute(
+                    "INSERT INTO builds (name, path, max_stack)"
+                    " VALUES (?, ?, ?)", (name, path, max_stack)).lastrowid
+            else:
+                build_id = row[0]
+                self.connection.execute(
+                    "UPDATE builds SET path = ?, max_stack = ? WHERE id = ?",
+                    (path, max_stack, build_id))
+                for table in ('segments', 'module_sizes', 'function_stacks'):
+                    self.connection.execute(
+                        "DELETE FROM {} WHERE build_id = ?".format(table),
+                        (build_id,))
+
+            self.connection.executemany(
+                "INSERT INTO segments VALUES (?, ?, ?, ?)",
+                ((build_id, seg.name, seg.start, seg.end)
+                 for seg in segments or []))
+
+            self.connection.executemany(
+                "INSERT INTO module_sizes VALUES (?, ?, ?, ?)",
+                ((build_id, module, section, size)
+                 for section, section_modules
+                 in aggregate_sizes(modules or []).items()
+                 for module, size in section_modules.items()))
+
+            if call_tree is not None:
+                functions = call_tree.functions
+                self.connection.executemany(
+                    "INSERT INTO function_stacks VALUES (?, ?, ?, ?)",
+                    ((build_id, function, functions[function]['size'],
+                      usage[0])
+                     for function, usage in call_tree.stack_usage().items()))
+
+    @staticmethod
+    def _metric(module=None, section=None, function=None):
+        """
+        SQL query and parameters of (build_id, build, value) for each build.
+        The value is the worst case stack of the function if given, else the
+        size of the module and/or section if given, else the worst case stack
+        of the build.
+        """
+        if function is not None:
+            return ("SELECT b.id AS build_id, b.name AS build,"
+                    " f.worst_stack AS value FROM function_stacks f"
+                    " JOIN builds b ON b.id = f.build_id"
+                    " WHERE f.function = ?", (function,))
+
+        if module is not None or section is not None:
+            conditions = []
+            parameters = []
+            if module is not None:
+                conditions.append("m.module = ?")
+                parameters.append(module)
+            if section is not None:
+                conditions.append("m.section = ?")
+                parameters.append(section)
+            return ("SELECT b.id AS build_id, b.name AS build,"
+                    " SUM(m.size) AS value FROM module_sizes m"
+                    " JOIN builds b ON b.id = m.build_id"
+                    " WHERE {} GROUP BY b.id".format(' AND '.join(conditions)),
+                    tuple(parameters))
+
+        return ("SELECT b.id AS build_id, b.name AS build,"
+                " b.max_stack AS value FROM builds b"
+                " WHERE b.max_stack IS NOT NULL", ())
+
+    def trend(self, module=None, section=None, function=None):
+        """
+        Evolution of a value over the builds, see _metric for the value
+        :return: list of (build name, value)
+        """
+        query, parameters = self._metric(module, section, function)
+        return self.connection.execute(
+            "SELECT build, value FROM ({}) ORDER BY build_id".format(query),
+            parameters).fetchall()
+
+    def first_exceeding(self, threshold, module=None, section=None,
+                        function=None):
+        """
+        First build where a value exceeded threshold, see _metric for the value
+        :return: (build name, value), None if the value never exceeded it
+        """
+        query, parameters = self._metric(module, section, function)
+        return self.connection.execute(
+            "SELECT build, value FROM ({}) WHERE value > ?"
+            " ORDER BY build_id LIMIT 1".format(query),
+            parameters + (threshold,)).fetchone()
+
+
+def ingest_map(history, name, path, parser, input_mode=reader.MMAP):
+    """
+    Parse a map file and store it in the history, the sections missing in
+    the file are skipped
+    """
+    objects = {}
+    with reader.open_map(path, input_mode) as maptext:
+        for key, getter in (('segments', parser.get_segments),
+                            ('modules', parser.get_modules),
+                            ('call_tree', parser.get_call_tree)):
+            try:
+                objects[key] = getter(maptext)
+            except ParserError:
+                pass
+    history.ingest(name, path=path, **objects)
+
+
+def make_argparser():
+    argparser = argparse.ArgumentParser(prog='mapography.history')
+    argparser.add_argument('database', help='SQLite database file')
+    subargparsers = argparser.add_subparsers(dest='action', metavar='action')
+
+    argparser_ingest = subargparsers.add_parser(
+        'ingest', help='Store a map file in the database')
+    argparser_ingest.add_argument(
+        'p',
+        choices=PARSERS.keys(),
+        help='Available parsers: {}'.format(', '.join(PARSERS.keys())),
+        metavar='parser')
+    argparser_ingest.add_argument('i', help='Input file', metavar='input_file')
+    argparser_ingest.add_argument(
+        '-b', '--build',
+        help='Build name, the input file name by default')
+
+    argparser_trend = subargparsers.add_parser(
+        'trend', help='Value for each build')
+    argparser_first = subargparsers.add_parser(
+        'first', help='First build where a value exceeded a threshold')
+    argparser_first.add_argument(
+        '-t', '--threshold', type=int, required=True)
+
+    for argparser_query in (argparser_trend, argparser_first):
+        argparser_query.add_argument(
+            '-m', '--module', help='Size of a module')
+        argparser_query.add_argument(
+            '-s', '--section', help='Size of a section')
+        argparser_query.add_argument(
+            '-f', '--function', help='Worst case stack of a function')
+
+    return argparser
+
+
+def execute(args):
+    history = History(args.database)
+    try:
+        if args.action == 'ingest':
+            ingest_map(history, args.build or args.i, args.i, PARSERS[args.p])
+        elif args.action == 'trend':
+            for build, value in history.trend(args.module, args.section,
+                                              args.function):
+                print('{}: {}'.format(build, value))
+        elif args.action == 'first':
+            first = history.first_exceeding(args.threshold, args.module,
+                                            args.section, args.function)
+            if first is None:
+                print('Never exceeded {}'.format(args.threshold))
+            else:
+                print('{}: {}'.format(*first))
+    finally:
+        history.close()
+
+
+if __name__ == '__main__':
+    execute(make_argparser().parse_args(sys.argv[1:]))
@@ -0,0 +1,160 @@
+# coding: utf-8
+
+"""
+Python API of a map file: the sections are parsed on their first access and
+kept, so that several analyses share a single parse.
+
+Usage example:
+with MapFile('big.map') as mapfile:
+    print(mapfile.call_tree.longest_path())
+    print(mapfile.run('modules', 'sizes', totals=True))
+"""
+
+import importlib
+import contextlib
+import collections.abc
+
+from mapography import commands, model, reader
+from mapography import parser as parsers
+
+
+class _LazyIndex(collections.abc.Mapping):
+    """
+    Index of the sections of a MapFile, scanned on its first access only:
+    a parser wrapper which doesn't parse (e.g. a cache hit) doesn't scan
+    """
+
+    def __init__(self, mapfile):
+        self.mapfile = mapfile
+
+    def __getitem__(self, title):
+        return self.mapfile.index[title]
+
+    def __iter__(self):
+        return iter(self.mapfile.index)
+
+    def __len__(self):
+        return len(self.mapfile.index)
+
+
+class MapFile(object):
+    """
+    An open map file whose sections are parsed when first accessed, through
+    the segments, modules, call_tree and symbols properties, and memoized.
+    It can be given to the commands in place of the parser: the get_*
+    functions return the memoized objects for the content of this map, and
+    parse other contents (e.g. the base of a diff) with the parser module.
+    It must be closed, e.g. by using it as a context manager.
+    """
+
+    # Functions of the parsers whose results are memoized
+    GETTERS = ('get_segments', 'get_modules', 'get_call_tree', 'get_symbols')
+
+    def __init__(self, path, parser=parsers.cosmic, input_mode=reader.MMAP):
+        """
+        :param path: map file path
+        :param parser: parser module, or a wrapper of it such as
+        cache.CachedParser
+        :param input_mode: see reader.open_map. A stream can be read once
+        only, in the order of the file: the sections must then be accessed in
+        that order.
+        """
+        self.path = path
+        self.parser = parser
+        self._stack = contextlib.ExitStack()
+        self.maptext = self._stack.enter_context(reader.open_map(path,
+                                                                 input_mode))
+        self._index = None
+        self._parsed = {}  # getter name -> parsed object
+
+    @property
+    def index(self):
+        """ Offsets of the sections (see index_sections), None for a stream """
+        if self._index is None and hasattr(self.maptext, 'find'):
+            self._index = self.parser.index_sections(self.maptext)
+        return self._index
+
+    def _get(self, name, maptext, index=None):
+        if maptext is not self.maptext:
+            # The parser wrappers (cache, parallel...) return the sections of
+            # their own file whatever the content: other contents are parsed
+            # by the parser module itself
+            module = importlib.import_module(self.parser.__name__)
+            return getattr(module, name)(maptext, index)
+        if name not in self._parsed:
+            index = _LazyIndex(self) if hasattr(self.maptext, 'find') else None
+            self._parsed[name] = getattr(self.parser, name)(self.maptext,
+                                                            index)
+        return self._parsed[name]
+
+    def get_address_index(self, maptext):
+        """
+        AddressIndex of the segments, modules and symbols, memoized like the
+        parsed sections for the content of this map
+        """
+        def make_index():
+            return model.AddressIndex(
+                segments=self.get_segments(maptext),
+                modules=self.get_modules(maptext),
+                symbols=self.get_symbols(maptext).symbols)
+
+        if maptext is not self.maptext:
+            return make_index()
+        if 'get_address_index' not in self._parsed:
+            self._parsed['get_address_index'] = make_index()
+        return self._parsed['get_address_index']
+
+    def prefetch(self, getters):
+        """
+        Parse together the sections of the getters which are not parsed yet,
+        if the parser can (see parallel.ParallelParser.prefetch)
+        :param getters: names of the get_* functions, e.g. ['get_modules']
+        """
+        prefetch = getattr(self.parser, 'prefetch', None)
+        if prefetch is not None:
+            prefetch([name for name in getters if name not in self._parsed])
+
+    @property
+    def segments(self):
+        """ List of Segment objects """
+        return self._get('get_segments', self.maptext)
+
+    @property
+    def modules(self):
+        """ List of Module objects """
+        return self._get('get_modules', self.maptext)
+
+    @property
+    def call_tree(self):
+        """ CallTree object """
+        return self._get('get_call_tree', self.maptext)
+
+    @property
+    def symbols(self):
+        """ SymbolTable object """
+        return self._get('get_symbols', self.maptext)
+
+    def run(self, command, subcommand, **options):
+        """
+        Run a command of the command line on this map
+        :param command: key of commands.commands, e.g. 'calls'
+        :param subcommand: e.g. 'longest'
+        :param options: keyword arguments of the command
+        :return: the command output, a string or an iterable of lines
+        """
+        func = getattr(commands.commands[command], subcommand)
+        return func(self.maptext, self, **options)
+
+    def close(self):
+        self._stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        if name in self.GETTERS:
+            return lambda maptext, index=None: self._get(name, maptext, index)
+        return getattr(self.parser, name)
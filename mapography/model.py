@@ -1,5 +1,9 @@
 # coding: utf-8
 
+import array
+import heapq
+import bisect
+
 __author__ = "Franck PARAT"
 
 
@@ -11,7 +15,84 @@ def _parse_address(address, base=16):
     return address
 
 
+# Status of the calls yielded by CallTree.walk
+CALL = 'call'
+LEAF = 'leaf'
+RECURSIVE = 'recursive'
+TRUNCATED = 'truncated'
+
+
+def _heavier(name, size, other_name, other_size):
+    """ Size comparison of call tree elements, ties broken by name """
+    return other_name is None or size > other_size or \
+        (size == other_size and name < other_name)
+
+
+def _draw_lines(root, calls_of, label_of, max_depth=None, drawn=None):
+    """
+    Lines of the drawing of a call tree, yielded as they are produced. The
+    first call of a function is drawn on its line, the others below it,
+    indented by the width of the labels of their callers. A call to a function
+    already in the current path is marked as recursive and not followed.
+    :param root: first node of the tree
+    :param calls_of: function node -> list of the nodes it calls
+    :param label_of: function node -> label string
+    :param max_depth: maximum number of nodes in a drawn path, the calls
+    beyond are marked with an ellipsis. None for no limit.
+    :param drawn: set of the nodes already drawn, updated. Their calls are
+    not drawn again, they are marked as drawn above. None to draw the calls
+    of every node.
+    :return: generator of lines
+    """
+    collapse = drawn is not None
+    label = label_of(root)
+    if collapse and root in drawn and calls_of(root):
+        yield label + " (above)"
+        return
+
+    on_path = {root}
+    line = [label]
+    # Per node of the path: node, iterator of its calls, indent of its calls
+    stack = [(root, iter(calls_of(root)), len(label))]
+    if collapse:
+        drawn.add(root)
+    first = True  # next call drawn on the line of its caller
+    while stack:
+        node, calls, indent = stack[-1]
+        for call in calls:
+            if not first:
+                yield ''.join(line)
+                line = [' ' * indent]
+
+            label = label_of(call)
+            children = calls_of(call)
+            if call in on_path:
+                line.append(label + " (recursive)")
+                first = False
+            elif max_depth is not None and len(stack) >= max_depth:
+                line.append(label + " ...")
+                first = False
+            elif collapse and children and call in drawn:
+                line.append(label + " (above)")
+                first = False
+            else:
+                line.append(label)
+                if collapse:
+                    drawn.add(call)
+                on_path.add(call)
+                stack.append((call, iter(children), indent + len(label)))
+                first = True
+                break
+        else:
+            stack.pop()
+            on_path.discard(node)
+            first = False
+    yield ''.join(line)
+
+
 class Segment(object):
+    __slots__ = ('name', '_start', '_end')
+
     def __init__(self, name, start, end):
         self.name = str(name)
         self._start = None
@@ -36,8 +117,20 @@ class Segment(object):
     def end(self, address):
         self._end = _parse_address(address)
 
+    @classmethod
+    def from_parsed(cls, name, start, end):
+        """
+        Fast constructor for data already validated by a parser: name is a
+        str, start and end are positive integers
+        """
+        segment = cls.__new__(cls)
+        segment.name = name
+        segment._start = start
+        segment._end = end
+        return segment
+
     def __len__(self):
-        return self.end - self.start
+        return self._end - self._start
 
     def __str__(self):
         return "Segment '{}', start {:#x}, end {:#x}, length {}".format(
@@ -49,6 +142,8 @@ class Segment(object):
 
 
 class Module (object):
+    __slots__ = ('name', 'segments')
+
     def __init__(self, name, segments=None):
         self.name = str(name)
 
@@ -61,6 +156,17 @@ class Module (object):
         else:
             self.segments = []
 
+    @classmethod
+    def from_parsed(cls, name, segments):
+        """
+        Fast constructor for data already validated by a parser: name is a
+        str, segments a list of Segment objects, used as is
+        """
+        module = cls.__new__(cls)
+        module.name = name
+        module.segments = segments
+        return module
+
     def add_segment(self, segment):
         if not isinstance(segment, Segment):
             raise ValueError("Not a Segment")
@@ -78,9 +184,15 @@ class Module (object):
 
 
 class Symbol(object):
-    def __init__(self, name, address):
+    __slots__ = ('name', '_address', 'module', 'section', 'used_in')
+
+    def __init__(self, name, address, module=None, section=None,
+                 used_in=None):
         self.name = str(name)
         self._address = _parse_address(address)
+        self.module = None if module is None else str(module)
+        self.section = None if section is None else str(section)
+        self.used_in = [] if used_in is None else [str(m) for m in used_in]
 
     @property
     def address(self):
@@ -90,8 +202,203 @@ class Symbol(object):
     def address(self, address):
         self._address = _parse_address(address)
 
-        
+    @classmethod
+    def from_parsed(cls, name, address, module=None, section=None,
+                    used_in=None):
+        """
+        Fast constructor for data already validated by a parser: name, module
+        and section are str or None, address a positive integer, used_in a
+        list of str, used as is
+        """
+        symbol = cls.__new__(cls)
+        symbol.name = name
+        symbol._address = address
+        symbol.module = module
+        symbol.section = section
+        symbol.used_in = [] if used_in is None else used_in
+        return symbol
+
+    def __str__(self):
+        s = "Symbol '{}', address {:#x}".format(self.name, self.address)
+        if self.module is not None:
+            s += ", defined in {}".format(self.module)
+        if self.section is not None:
+            s += ", section {}".format(self.section)
+        return s
+
+    def __repr__(self):
+        return "Symbol(name='{}', address={:#x})".format(
+            self.name, self.address)
+
+
+class SymbolTable(object):
+    """
+    Symbols of a map file, indexed by name, by defining module and by using
+    module
+    """
+    def __init__(self, symbols=None):
+        self.symbols = []
+        self.by_name = {}
+        self.defined_in = {}
+        self.used_in = {}
+
+        for symbol in symbols or []:
+            self.add_symbol(symbol)
+
+    def add_symbol(self, symbol):
+        if not isinstance(symbol, Symbol):
+            raise ValueError("Not a Symbol")
+        self.symbols.append(symbol)
+        self.by_name[symbol.name] = symbol
+        self.defined_in.setdefault(symbol.module, []).append(symbol)
+        for module in symbol.used_in:
+            self.used_in.setdefault(module, []).append(symbol)
+
+    def symbols_defined_by(self, module):
+        """ List of the symbols defined in a module """
+        return self.defined_in.get(module, [])
+
+    def symbols_used_by(self, module):
+        """ List of the symbols used in a module """
+        return self.used_in.get(module, [])
+
+    def unused(self):
+        """ List of the symbols not used in any module """
+        return [symbol for symbol in self.symbols if not symbol.used_in]
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    def __getitem__(self, name):
+        return self.by_name[name]
+
+
+class AddressIndex(object):
+    """
+    Index of the address ranges of segments, of the segments of modules and
+    of the symbol addresses, to find what owns an address by bisection.
+
+    The segments are grouped by name, the segments of a same name being
+    assumed not to overlap. A lookup costs one bisection per segment name,
+    and one symbol bisection per segment containing the address.
+    """
+    def __init__(self, segments=None, modules=None, symbols=None):
+        self._segments = self._make_intervals(
+            (segment, segment) for segment in segments or [])
+        self._module_segments = self._make_intervals(
+            (segment, module) for module in modules or []
+            for segment in module.segments)
+
+        symbols = sorted(symbols or [], key=lambda sym: sym.address)
+        self._symbol_addresses = [symbol.address for symbol in symbols]
+        self._symbols = symbols
+
+        # Symbols by section, the ones without section under None
+        self._section_symbols = {}
+        for symbol in symbols:
+            addresses, section_symbols = self._section_symbols.setdefault(
+                symbol.section, ([], []))
+            addresses.append(symbol.address)
+            section_symbols.append(symbol)
+
+    @staticmethod
+    def _make_intervals(items):
+        """
+        (segment, owner) items -> list of (segment name, starts, ends,
+        owners), sorted by name, the lists sorted by start, empty segments
+        excluded
+        """
+        groups = {}
+        for segment, owner in items:
+            if len(segment) > 0:
+                groups.setdefault(segment.name, []).append(
+                    (segment.start, segment.end, owner))
+
+        intervals = []
+        for name in sorted(groups):
+            group = sorted(groups[name], key=lambda interval: interval[0])
+            intervals.append((name,
+                              [interval[0] for interval in group],
+                              [interval[1] for interval in group],
+                              [interval[2] for interval in group]))
+        return intervals
+
+    @staticmethod
+    def _find(intervals, address):
+        """ Owners of the intervals containing address, by segment name """
+        found = []
+        for name, starts, ends, owners in intervals:
+            position = bisect.bisect_right(starts, address) - 1
+            if position >= 0 and address < ends[position]:
+                found.append((name, owners[position]))
+        return found
+
+    @staticmethod
+    def _closest(addresses, symbols, address, lowest=0):
+        """ Closest symbol at or below address and at or above lowest """
+        position = bisect.bisect_right(addresses, address) - 1
+        if position >= 0 and addresses[position] >= lowest:
+            return symbols[position]
+        return None
+
+    def lookup(self, address):
+        """
+        Find what owns an address
+        :param address: integer address, or hexadecimal string
+        :return: dictionary with the following keys:
+            - address: the address as integer
+            - segments: list of the Segment objects containing the address
+            - modules: list of (segment name, Module) of the module segments
+            containing the address
+            - symbol: (Symbol, offset of the address from the symbol) for the
+            closest symbol at or below the address, in a segment containing
+            the address and named as the section of the symbol. A symbol
+            without section must be in the containing segment starting the
+            highest. Any symbol if the index has no segments. None if there
+            is no such symbol.
+        """
+        address = _parse_address(address)
+
+        segments = [segment for _, segment in
+                    self._find(self._segments, address)]
+        modules = self._find(self._module_segments, address)
+
+        if not self._segments:
+            candidates = [self._closest(self._symbol_addresses,
+                                        self._symbols, address)]
+        else:
+            candidates = []
+            for segment in segments:
+                if segment.name in self._section_symbols:
+                    addresses, symbols = self._section_symbols[segment.name]
+                    candidates.append(self._closest(addresses, symbols,
+                                                    address, segment.start))
+            if segments and None in self._section_symbols:
+                addresses, symbols = self._section_symbols[None]
+                candidates.append(self._closest(
+                    addresses, symbols, address,
+                    max(segment.start for segment in segments)))
+
+        symbol = None
+        for candidate in candidates:
+            if candidate is not None and (
+                    symbol is None or candidate.address > symbol[0].address):
+                symbol = (candidate, address - candidate.address)
+
+        return {'address': address, 'segments': segments,
+                'modules': modules, 'symbol': symbol}
+
+    def lookup_many(self, addresses):
+        """ Batch version of lookup, returns a list of the results """
+        return [self.lookup(address) for address in addresses]
+
+
 class CallTreeNode(object):
+    __slots__ = ('name', 'size', 'calls')
+
     def __init__(self, name, calls=None, size=None):
         self.name = str(name)
         self.size = size
@@ -110,34 +417,465 @@ class CallTreeNode(object):
         else:
             raise ValueError("Not a CallTree")
             
-    def __str__(self):
+    def label(self):
         if self.size is None:
-            selftree_init = " - {}".format(self.name)
+            return " - {}".format(self.name)
         else:
-            selftree_init = " - {} ({})".format(self.name, self.size)
+            return " - {} ({})".format(self.name, self.size)
 
-        if not self.calls:
-            return selftree_init
+    def draw_lines(self, max_depth=None, collapse=False):
+        """
+        Draw the call tree below this node line by line, see _draw_lines
+        :return: generator of lines
+        """
+        return _draw_lines(self, lambda node: node.calls,
+                           CallTreeNode.label, max_depth,
+                           set() if collapse else None)
 
-        subtree = []
-        for call in self.calls:
-            subtree.append(str(call))
+    def draw(self, max_depth=None, collapse=False):
+        """
+        Format the call tree below this node
+        :param max_depth: maximum number of nodes in a drawn path, the calls
+        beyond are marked with an ellipsis. None for no limit.
+        :param collapse: draw the calls of a node only the first time
+        :return: formatted string
+        """
+        return '\n'.join(self.draw_lines(max_depth, collapse))
 
-        selftree = selftree_init + "\n".join(subtree)
-        selftree = selftree.replace("\n", "\n" + (" " * len(selftree_init)))
-        return selftree
+    def __str__(self):
+        return self.draw()
 
     def __repr__(self):
         return "CallTree({})".format(self.name)
 
 
+class CompactCallGraph(object):
+    """
+    Compact form of a call graph: the functions are numbered in the order of
+    their names, their stack sizes are in an array and their calls in CSR
+    form, the ids of the functions called by function n being
+    callees[offsets[n]:offsets[n + 1]], sorted. The graph is immutable, the
+    traversals work on integers without hashing the names.
+    """
+
+    __slots__ = ('names', 'ids', 'sizes', 'offsets', 'callees', 'roots',
+                 '_stack_usage', '_callers', '_entry_depth', '_components',
+                 '_reaching_roots')
+
+    def __init__(self, names, sizes, offsets, callees, roots):
+        """
+        :param names: list of the function names, sorted
+        :param sizes: array of the stack sizes, by function id
+        :param offsets: array of the offsets of the calls of each function in
+        callees, one more than the functions
+        :param callees: array of the ids of the called functions
+        :param roots: array of the ids of the roots, sorted
+        """
+        self.names = names
+        self.ids = {name: n for n, name in enumerate(names)}
+        self.sizes = sizes
+        self.offsets = offsets
+        self.callees = callees
+        self.roots = roots
+        self._stack_usage = None
+        self._callers = None
+        self._entry_depth = None
+        self._components = None
+        self._reaching_roots = None
+
+    @classmethod
+    def from_call_tree(cls, call_tree):
+        functions = call_tree.functions
+        names = sorted(functions)
+        ids = {name: n for n, name in enumerate(names)}
+
+        sizes = array.array('l', [functions[name]['size'] for name in names])
+        offsets = array.array('l', [0])
+        callees = array.array('l')
+        for name in names:
+            callees.extend(sorted([ids[call]
+                                   for call in functions[name]['calls']]))
+            offsets.append(len(callees))
+        roots = array.array('l', sorted([ids[root]
+                                         for root in call_tree.roots]))
+        return cls(names, sizes, offsets, callees, roots)
+
+    def __len__(self):
+        return len(self.names)
+
+    def calls(self, function):
+        """ Ids of the functions called by a function, sorted """
+        return self.callees[self.offsets[function]:self.offsets[function + 1]]
+
+    def callers(self, function):
+        """
+        Ids of the functions calling a function, sorted. The reverse edges are
+        indexed in CSR form on the first call.
+        """
+        if self._callers is None:
+            count = len(self.names)
+            caller_offsets = array.array('l', [0]) * (count + 1)
+            for call in self.callees:
+                caller_offsets[call + 1] += 1
+            for n in range(count):
+                caller_offsets[n + 1] += caller_offsets[n]
+
+            # The callers are placed in increasing order, so sorted
+            callers = array.array('l', [0]) * len(self.callees)
+            next_positions = caller_offsets[:-1]
+            for caller in range(count):
+                for position in range(self.offsets[caller],
+                                      self.offsets[caller + 1]):
+                    call = self.callees[position]
+                    callers[next_positions[call]] = caller
+                    next_positions[call] += 1
+            self._callers = caller_offsets, callers
+
+        caller_offsets, callers = self._callers
+        return callers[caller_offsets[function]:caller_offsets[function + 1]]
+
+    def walk(self, roots=None, max_depth=None):
+        """
+        Depth first walk of the call graph, see CallTree.walk
+        :param roots: ids of the functions to start from, roots of the graph
+        by default
+        :return: generator of (path, status), path being the list of the
+        function ids, updated between iterations
+        """
+        offsets, callees = self.offsets, self.callees
+        on_path = bytearray(len(self.names))
+        if roots is None:
+            roots = self.roots
+
+        for root in roots:
+            path = []
+            positions = []  # per function of path, position of its next call
+            call = root
+            while True:
+                if call is not None:
+                    path.append(call)
+                    if on_path[call]:
+                        yield path, RECURSIVE
+                        path.pop()
+                    elif max_depth is not None and len(path) > max_depth:
+                        yield path, TRUNCATED
+                        path.pop()
+                    else:
+                        enterable = False
+                        if max_depth is None or len(path) < max_depth:
+                            for position in range(offsets[call],
+                                                  offsets[call + 1]):
+                                called = callees[position]
+                                if called != call and not on_path[called]:
+                                    enterable = True
+                                    break
+                        yield path, CALL if enterable else LEAF
+                        on_path[call] = 1
+                        positions.append(offsets[call])
+
+                if not positions:
+                    break
+                position = positions[-1]
+                if position < offsets[path[-1] + 1]:
+                    positions[-1] = position + 1
+                    call = callees[position]
+                else:
+                    positions.pop()
+                    on_path[path.pop()] = 0
+                    call = None
+
+    def iter_call_paths(self, max_depth=None, min_stack=None):
+        """
+        Generate the function call paths, see CallTree.iter_call_paths
+        :return: generator of (stack size, list of function ids)
+        """
+        sizes = self.sizes
+        for path, status in self.walk(max_depth=max_depth):
+            if status == LEAF:
+                stack_size = sum([sizes[call] for call in path])
+                if min_stack is None or stack_size >= min_stack:
+                    yield stack_size, path
+
+    def strong_components(self):
+        """
+        Strongly connected components of the call graph, with an iterative
+        Tarjan's algorithm. A component is found after all the components it
+        calls, so the callees come first. The result is memoized.
+        :return: (list of the components, lists of function ids in the order
+        of the walk, array of the index of the component of each function)
+        """
+        if self._components is not None:
+            return self._components
+
+        offsets, callees = self.offsets, self.callees
+        count = len(self.names)
+        index = array.array('l', [-1]) * count
+        lowlink = array.array('l', [0]) * count
+        on_stack = bytearray(count)
+        scc_stack = []
+        components = []
+        component_of = array.array('l', [0]) * count
+        visited = 0
+
+        for start in range(count):
+            if index[start] >= 0:
+                continue
+
+            index[start] = lowlink[start] = visited
+            visited += 1
+            scc_stack.append(start)
+            on_stack[start] = 1
+            path = [start]
+            positions = [offsets[start]]
+            while path:
+                function = path[-1]
+                position = positions[-1]
+                if position < offsets[function + 1]:
+                    positions[-1] = position + 1
+                    call = callees[position]
+                    if index[call] < 0:
+                        index[call] = lowlink[call] = visited
+                        visited += 1
+                        scc_stack.append(call)
+                        on_stack[call] = 1
+                        path.append(call)
+                        positions.append(offsets[call])
+                    elif on_stack[call] and index[call] < lowlink[function]:
+                        lowlink[function] = index[call]
+                    continue
+
+                path.pop()
+                positions.pop()
+                if path and lowlink[function] < lowlink[path[-1]]:
+                    lowlink[path[-1]] = lowlink[function]
+
+                if lowlink[function] == index[function]:
+                    position = len(scc_stack) - 1
+                    while scc_stack[position] != function:
+                        position -= 1
+                    component = scc_stack[position:]
+                    del scc_stack[position:]
+                    for member in component:
+                        on_stack[member] = 0
+                        component_of[member] = len(components)
+                    components.append(component)
+
+        self._components = components, component_of
+        return self._components
+
+    def stack_usage(self):
+        """
+        Worst case stack usage of every function, see CallTree.stack_usage.
+        It is computed on the components of the graph, callees first. The
+        functions of a recursive cycle all get the same usage: the sizes of
+        all the functions of the cycle, which bounds every call path entering
+        it, plus the heaviest call out of the cycle. The result is memoized.
+        :return: (array of the worst case stack sizes, array of the id of the
+        called function on the heaviest chain or -1, the function called out
+        of the cycle for the functions of a recursive cycle), by function id
+        """
+        if self._stack_usage is not None:
+            return self._stack_usage
+
+        offsets, callees, sizes = self.offsets, self.callees, self.sizes
+        count = len(self.names)
+        usage = array.array('l', [0]) * count
+        heaviest_calls = array.array('l', [-1]) * count
+        components, component_of = self.strong_components()
+
+        for n, component in enumerate(components):
+            # The calls are sorted by name, the first heaviest one wins
+            heaviest, heaviest_size = -1, 0
+            for function in sorted(component):
+                for position in range(offsets[function],
+                                      offsets[function + 1]):
+                    call = callees[position]
+                    if component_of[call] != n and (
+                            heaviest < 0 or usage[call] > heaviest_size):
+                        heaviest, heaviest_size = call, usage[call]
+
+            component_size = sum([sizes[function] for function in component])
+            for function in component:
+                usage[function] = component_size + heaviest_size
+                heaviest_calls[function] = heaviest
+
+        self._stack_usage = usage, heaviest_calls
+        return self._stack_usage
+
+    def heaviest_path(self, function):
+        """
+        Heaviest chain of calls from a function, the sizes of its functions
+        summing to the stack usage of the function (see stack_usage). The
+        functions of a recursive cycle are listed in depth first order from
+        the function entering the cycle.
+        :return: list of function ids
+        """
+        offsets, callees = self.offsets, self.callees
+        _, heaviest_calls = self.stack_usage()
+        components, component_of = self.strong_components()
+
+        path = []
+        while function >= 0:
+            component = component_of[function]
+            if len(components[component]) == 1:
+                path.append(function)
+            else:
+                # Depth first order of the cycle, calls in order of the names
+                visited = set()
+                stack = [function]
+                while stack:
+                    member = stack.pop()
+                    if member in visited:
+                        continue
+                    visited.add(member)
+                    path.append(member)
+                    stack.extend(
+                        call for call in reversed(
+                            callees[offsets[member]:offsets[member + 1]])
+                        if component_of[call] == component and
+                        call not in visited)
+            function = heaviest_calls[function]
+        return path
+
+    def entry_depth(self):
+        """
+        Worst case stack usage at the entry of every function: the heaviest
+        chain of calls from a root to the function, the function excluded.
+        The functions are processed in topological order of a depth first
+        walk from the roots, the calls closing a cycle are ignored. The
+        result is memoized.
+        :return: (array of the stack sizes at entry, -1 for the functions not
+        reachable from a root, array of the id of the caller on the heaviest
+        chain or -1), by function id
+        """
+        if self._entry_depth is not None:
+            return self._entry_depth
+
+        offsets, callees, sizes = self.offsets, self.callees, self.sizes
+        count = len(self.names)
+
+        # Post-order of the walk from the roots
+        post_order = []
+        visited = bytearray(count)
+        for root in self.roots:
+            if visited[root]:
+                continue
+            visited[root] = 1
+            path = [root]
+            positions = [offsets[root]]
+            while path:
+                function = path[-1]
+                position = positions[-1]
+                if position < offsets[function + 1]:
+                    positions[-1] = position + 1
+                    call = callees[position]
+                    if not visited[call]:
+                        visited[call] = 1
+                        path.append(call)
+                        positions.append(offsets[call])
+                else:
+                    path.pop()
+                    positions.pop()
+                    post_order.append(function)
+
+        # In reverse post-order, only the calls closing a cycle go backwards
+        order = post_order[::-1]
+        rank = array.array('l', [0]) * count
+        for n, function in enumerate(order):
+            rank[function] = n
+
+        depth = array.array('l', [-1]) * count
+        heaviest_callers = array.array('l', [-1]) * count
+        for root in self.roots:
+            depth[root] = 0
+        for function in order:
+            caller_depth = depth[function] + sizes[function]
+            for position in range(offsets[function], offsets[function + 1]):
+                call = callees[position]
+                if rank[call] > rank[function] and caller_depth > depth[call]:
+                    depth[call] = caller_depth
+                    heaviest_callers[call] = function
+
+        self._entry_depth = depth, heaviest_callers
+        return self._entry_depth
+
+    def reaching_roots(self, function):
+        """
+        Ids of the roots from which a function can be called, sorted. The
+        roots reaching every component of the graph are computed on the first
+        call, in a single pass over the components, callers first: the roots
+        are bits of an integer, the mask of a component being merged into the
+        ones of the components it calls.
+        """
+        components, component_of = self.strong_components()
+        if self._reaching_roots is None:
+            offsets, callees = self.offsets, self.callees
+            root_bits = {root: 1 << n for n, root in enumerate(self.roots)}
+            masks = [0] * len(components)
+            for n in range(len(components) - 1, -1, -1):
+                mask = masks[n]
+                for member in components[n]:
+                    mask |= root_bits.get(member, 0)
+                masks[n] = mask
+                for member in components[n]:
+                    for position in range(offsets[member],
+                                          offsets[member + 1]):
+                        call_component = component_of[callees[position]]
+                        if call_component != n:
+                            masks[call_component] |= mask
+            self._reaching_roots = masks
+
+        mask = self._reaching_roots[component_of[function]]
+        return [root for n, root in enumerate(self.roots) if mask >> n & 1]
+
+    def longest_path(self):
+        """
+        Call path with the highest stack usage, see CallTree.longest_path
+        :return: (stack size, list of function ids)
+        """
+        usage, _ = self.stack_usage()
+
+        root = -1
+        for function in self.roots:
+            if root < 0 or usage[function] > usage[root]:
+                root = function
+        if root < 0:
+            return 0, []
+        return usage[root], self.heaviest_path(root)
+
+    def draw_lines(self, max_depth=None, collapse=False):
+        """
+        Draw the call tree from each root line by line, see CallTree.draw_lines
+        :return: generator of lines
+        """
+        names, sizes = self.names, self.sizes
+        labels = [None] * len(names)
+
+        def label_of(function):
+            label = labels[function]
+            if label is None:
+                label = labels[function] = " - {} ({})".format(
+                    names[function], sizes[function])
+            return label
+
+        drawn = set() if collapse else None
+        for root in self.roots:
+            for line in _draw_lines(root, self.calls, label_of, max_depth,
+                                    drawn):
+                yield line
+
+
 class CallTree(object):
     def __init__(self):
         self.functions = dict()
         self.roots = set()
+        self._stack_usage = None
+        self._compact = None
 
     def add_function(self, name, size, calls=None, pointer=False,
                      recursive=False):
+        self._stack_usage = None
+        self._compact = None
         self.functions[name] = {
             'name': name,
             'size': int(size),
@@ -150,6 +888,8 @@ class CallTree(object):
         if called_name not in self.functions:
             raise ValueError("Function must be declared using add_function")
 
+        self._stack_usage = None
+        self._compact = None
         if caller_name is None:
             self.roots.add(called_name)
         elif caller_name in self.functions:
@@ -157,48 +897,201 @@ class CallTree(object):
         else:
             raise ValueError("Function must be declared using add_function")
 
-    def call_paths(self):
+    def compact(self):
+        """
+        Compact form of the call graph, used by the traversals. It is built
+        once and memoized until the tree changes.
+        :return: CompactCallGraph
+        """
+        if self._compact is None:
+            self._compact = CompactCallGraph.from_call_tree(self)
+        return self._compact
+
+    def walk(self, roots=None, max_depth=None):
+        """
+        Depth first walk of the call graph, iterative so that the Python call
+        stack doesn't limit the depth, and safe against recursive calls
+        :param roots: names of the functions to start from, sorted roots of
+        the tree by default
+        :param max_depth: maximum number of functions in a walked path, None
+        for no limit
+        :return: generator of (path, status) for each call visited in depth
+        first order, path being the list of function names from the root to
+        the call (the same list is updated between iterations, copy it to keep
+        it) and status one of:
+            - CALL: the function is entered, its calls come next
+            - LEAF: the function is entered but has no call to follow
+            - RECURSIVE: the function is already in the path, not entered
+            - TRUNCATED: the path is max_depth long, the function is not
+            entered
+        """
+        graph = self.compact()
+        if roots is not None:
+            roots = [graph.ids[root] for root in roots]
+        names = graph.names
+        for path, status in graph.walk(roots, max_depth):
+            yield [names[call] for call in path], status
+
+    def iter_call_paths(self, max_depth=None, min_stack=None):
+        """
+        Generate the function call paths lazily, in depth first order. A path
+        ends at a function without calls to follow: recursive calls are not
+        followed (see recursive_cycles) and paths are cut at max_depth
+        functions.
+        :param max_depth: maximum number of functions in a path, None for no
+        limit
+        :param min_stack: only generate the paths with a stack size of at
+        least min_stack, None for all paths
+        :return: generator of path infos, a path info being a tuple
+        (stack size, list of (function names, function size))
+        """
+        graph = self.compact()
+        for stack_size, path in graph.iter_call_paths(max_depth, min_stack):
+            yield stack_size, self._named_path(graph, path)
+
+    @staticmethod
+    def _named_path(graph, path):
+        return [(graph.names[call], graph.sizes[call]) for call in path]
+
+    def call_paths(self, max_depth=None, min_stack=None, top=None):
         """
-        Search all the possible function call paths
+        Search all the possible function call paths (see iter_call_paths),
+        sorted by stack size then alphabetically
+        :param max_depth: see iter_call_paths
+        :param min_stack: see iter_call_paths
+        :param top: only return the top heaviest paths, selected with a
+        bounded heap so that the memory usage doesn't depend on the number of
+        paths. None for all paths.
         :return: list of path infos, a path info being a tuple
-        (list of (function names, function size), stack size)
-        """
-        call_paths = []
-        
-        def inspect_node(path):
-            func = self.functions[path[-1][0]]
-            neighbors = []
-            if not func['calls']:
-                call_paths.append((sum(c[1] for c in path), path))
-            else:
-                for call in func['calls']:
-                    inspect_node(path + [(call, self.functions[call]['size'])])
-        
-        for root in self.roots:
-            inspect_node([(root, self.functions[root]['size'])])
-        call_paths.sort(key=lambda p: p[1][0])  # sort alphabetically
-        call_paths.sort(key=lambda p: p[0], reverse=True)  # sort by size
+        (stack size, list of (function names, function size))
+        """
+        # The paths are selected as lists of function ids, the ids are in
+        # the order of the names, and only the selected ones are named
+        graph = self.compact()
+        call_paths = ((stack_size, list(path)) for stack_size, path
+                      in graph.iter_call_paths(max_depth, min_stack))
+        order = (lambda p: (-p[0], p[1][0]))  # by size then alphabetically
+
+        if top is not None:
+            selected = heapq.nsmallest(top, call_paths, key=order)
+        else:
+            selected = sorted(call_paths, key=order)
+        return [(stack_size, self._named_path(graph, path))
+                for stack_size, path in selected]
 
-        return call_paths
+    def recursive_cycles(self):
+        """
+        Find the recursive cycles of the call graph, i.e. the strongly
+        connected components of more than one function, and the functions
+        calling themselves or declared recursive. See
+        CompactCallGraph.strong_components.
+        :return: sorted list of cycles, a cycle being a sorted list of
+        function names
+        """
+        graph = self.compact()
+        cycles = []
+        for component in graph.strong_components()[0]:
+            names = sorted([graph.names[function] for function in component])
+            func = self.functions[names[0]]
+            if len(names) > 1 or func['recursive'] or \
+                    names[0] in func['calls']:
+                cycles.append(names)
+
+        return sorted(cycles)
+
+    def stack_usage(self):
+        """
+        Compute the worst case stack usage of every function: its own stack
+        size plus the heaviest chain of calls below it. Each function and each
+        call is visited once, the result is memoized until the tree changes.
+        A recursive cycle (see recursive_cycles) is counted as the sizes of
+        all its functions, see CompactCallGraph.stack_usage.
+        :return: dict function name -> (worst case stack size, name of the
+        called function on the heaviest chain or None, the function called
+        out of the cycle for the functions of a recursive cycle)
+        """
+        if self._stack_usage is not None:
+            return self._stack_usage
+
+        graph = self.compact()
+        names = graph.names
+        usage, heaviest_calls = graph.stack_usage()
+        self._stack_usage = {
+            name: (usage[n], names[heaviest_calls[n]]
+                   if heaviest_calls[n] >= 0 else None)
+            for n, name in enumerate(names)}
+        return self._stack_usage
+
+    def heaviest_path(self, name):
+        """
+        Heaviest chain of calls from a function, see
+        CompactCallGraph.heaviest_path
+        :return: list of (function name, function size)
+        """
+        graph = self.compact()
+        return self._named_path(graph, graph.heaviest_path(graph.ids[name]))
 
     def longest_path(self):
-        """ Return the longest call path (see call_paths) """
-        try:
-            return max(self.call_paths(), key=lambda n: n[1])
-        except ValueError:
-            return 0, []
+        """
+        Return the call path with the highest stack usage, in the same format
+        as the elements returned by call_paths. Computed from stack_usage in
+        linear time, without enumerating the paths. With recursive cycles, it
+        is at least the stack size of every call path.
+        """
+        graph = self.compact()
+        stack_size, path = graph.longest_path()
+        return stack_size, self._named_path(graph, path)
+
+    def callers(self, name):
+        """ Names of the functions calling a function, sorted """
+        graph = self.compact()
+        return [graph.names[caller]
+                for caller in graph.callers(graph.ids[name])]
+
+    def entry_depth(self, name):
+        """
+        Worst case stack usage at the entry of a function: the heaviest chain
+        of calls from a root to the function, the function excluded. The
+        depths of all the functions are computed on the first call.
+        :return: (stack size, list of (function name, function size) from the
+        root to the function), (None, []) if no root calls the function
+        """
+        graph = self.compact()
+        depth, heaviest_callers = graph.entry_depth()
+        function = graph.ids[name]
+        if depth[function] < 0:
+            return None, []
 
-    def draw_call_tree(self):
-        """ Returns formatted string representing the call tree """
-        # easy way maybe not efficient but good enough for now: use CallTreeNode
-        nodes = {func['name']: CallTreeNode(func['name'], size=func['size'])
-                 for func in self.functions.values()}
+        path = []
+        while function >= 0:
+            path.append(function)
+            function = heaviest_callers[function]
+        return depth[graph.ids[name]], self._named_path(graph, path[::-1])
 
-        for name, node in nodes.items():
-            for called in self.functions[name]['calls']:
-                node.add_call(nodes[called])
+    def reaching_roots(self, name):
+        """ Names of the roots from which a function can be called, sorted """
+        graph = self.compact()
+        return [graph.names[root]
+                for root in graph.reaching_roots(graph.ids[name])]
 
-        return '\n'.join([str(nodes[root]) for root in sorted(self.roots)])
+    def draw_lines(self, max_depth=None, collapse=False):
+        """
+        Draw the call tree from each root line by line, in time proportional
+        to the output
+        :param max_depth: see CallTreeNode.draw
+        :param collapse: draw the calls of a function only the first time
+        it is met, including from an other root
+        :return: generator of lines
+        """
+        return self.compact().draw_lines(max_depth, collapse)
+
+    def draw_call_tree(self, max_depth=None, collapse=False):
+        """
+        Returns formatted string representing the call tree
+        :param max_depth: see CallTreeNode.draw
+        :param collapse: see draw_lines
+        """
+        return '\n'.join(self.draw_lines(max_depth, collapse))
 
     def __str__(self):
         s = "{}: \n".format(self.__class__.__name__)
@@ -0,0 +1,123 @@
+# coding: utf-8
+
+"""
+Parsing of the sections of a map file in parallel, in a pool of worker
+processes. The workers read the map file themselves, only the section
+offsets are sent to them and only the parsed objects come back.
+"""
+
+import os
+import concurrent.futures
+
+from mapography import profiling, reader
+
+
+class ParallelParser(object):
+    """
+    Wrapper of a parser module for one map file, which parses a section when
+    a get_* function asks for it first: the symbols section is split in
+    chunks at record boundaries, parsed in parallel, the other sections are
+    parsed in the calling process. The sections known to be needed can be
+    parsed in parallel with each other beforehand, see prefetch. It can be
+    given to the commands in place of the parser, it must be closed to stop
+    the workers, e.g. by using it as a context manager.
+    """
+
+    def __init__(self, parser, path, jobs=None, chunks=None):
+        """
+        :param parser: parser module, with GETTER_SECTIONS, split_section,
+        parse_range and merge_ranges
+        :param path: map file path, not compressed: each worker would
+        decompress the whole file
+        :param jobs: number of worker processes, number of CPUs if None
+        :param chunks: number of chunks of the symbols section, number of
+        workers if None
+        :raise ValueError: if the file is compressed
+        """
+        if reader.compression(path) is not None:
+            raise ValueError("The sections of the compressed file '{}' can't "
+                             "be parsed in parallel".format(path))
+        self.parser = parser
+        self.path = path
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs)
+        self.chunks = jobs if chunks is None else chunks
+        self.index = None
+        self.results = {}  # section title -> parsed object
+
+    def _ranges(self, titles):
+        """ Dict title -> ranges (see split_section) of the found sections """
+        with reader.open_map(self.path) as maptext:
+            if self.index is None:
+                self.index = self.parser.index_sections(maptext)
+            return {title: self.parser.split_section(maptext, title,
+                                                     self.chunks, self.index)
+                    for title in titles if title in self.index}
+
+    def _parse_ranges(self, ranges):
+        """
+        Parse sections in the workers, the ranges of all of them being
+        submitted at once
+        :param ranges: dict title -> ranges
+        """
+        with profiling.stage('parallel wait'):
+            futures = {title: [self.executor.submit(self.parser.parse_range,
+                                                    self.path, title, start,
+                                                    end)
+                               for start, end in title_ranges]
+                       for title, title_ranges in ranges.items()}
+            for title, title_futures in futures.items():
+                self.results[title] = self.parser.merge_ranges(
+                    title, [future.result() for future in title_futures])
+
+    def _parse(self, name, title):
+        ranges = self._ranges([title])
+        if len(ranges.get(title, [])) <= 1:
+            # Sending a single range to a worker would only add the transfer
+            # of the result. A missing section makes the parser raise the
+            # error.
+            with reader.open_map(self.path) as maptext:
+                self.results[title] = getattr(self.parser, name)(maptext,
+                                                                 self.index)
+        else:
+            self._parse_ranges(ranges)
+
+    def _get(self, name):
+        title = self.parser.GETTER_SECTIONS[name]
+        if title not in self.results:
+            self._parse(name, title)
+        return self.results[title]
+
+    def prefetch(self, getters):
+        """
+        Parse the sections of several getters together, in the workers, so
+        that the sections are parsed in parallel with each other. The missing
+        sections are left to the getters, which raise the error.
+        :param getters: names of the get_* functions, e.g. ['get_modules',
+        'get_symbols']
+        """
+        titles = []
+        for name in getters:
+            title = self.parser.GETTER_SECTIONS[name]
+            if title not in self.results and title not in titles:
+                titles.append(title)
+
+        ranges = self._ranges(titles)
+        if sum(len(title_ranges) for title_ranges in ranges.values()) > 1:
+            self._parse_ranges(ranges)
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        if name in self.parser.GETTER_SECTIONS:
+            return lambda maptext, index=None: self._get(name)
+        return getattr(self.parser, name)
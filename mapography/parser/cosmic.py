@@ -1,40 +1,302 @@
 # coding: utf-8
 
 import re
+import sys
+import collections
 
-from mapography.model import CallTree, Segment, Module
+from mapography.model import CallTree, Segment, Module, Symbol, SymbolTable
+from mapography import reader
+from mapography.profiling import profiled
+
+
+# Version of the parsed objects format, to change when the parser or the
+# model objects change so that the cached objects are not reused
+PARSER_VERSION = 5
 
 
 class ParserError(Exception):
     pass
 
 
-def extract_segments(maptext):
+# Titles of the map file sections
+SEGMENTS = 'Segments'
+MODULES = 'Modules'
+STACK_USAGE = 'Stack usage'
+CALL_TREE = 'Call tree'
+SYMBOLS = 'Symbols'
+
+# End markers of the sections which can be followed by something else than
+# another section. The other sections end at the next section or at the end of
+# the file.
+SECTION_TERMINATORS = {
+    SEGMENTS: '\n\n\n',
+    MODULES: '\n\n\n',
+    CALL_TREE: '\n\n\n\n'
+}
+
+# Section title framed by lines of dashes. It starts with the dashes so that
+# the regex engine can skip quickly to the candidates.
+SECTION_HEADER_REGEX = r"""
+---+[ \t]*\r?\n
+[ \t]*(?P<title>[^\s-][^\r\n]*?)[ \t]*\r?\n
+[ \t]*---+[ \t]*\r?\n
+"""
+_SECTION_HEADER = re.compile(SECTION_HEADER_REGEX, flags=re.VERBOSE)
+_SECTION_HEADER_BYTES = re.compile(SECTION_HEADER_REGEX.encode('ascii'),
+                                   flags=re.VERBOSE)
+
+ENCODING = 'utf-8'
+
+
+def _text(maptext, text):
+    """ Convert a str constant to the type of maptext (str or bytes) """
+    return text if isinstance(maptext, str) else text.encode(ENCODING)
+
+
+@profiled()
+def index_sections(maptext):
+    """
+    Locate all the sections of the map file content in a single scan
+    :param maptext: map file content, str or bytes-like object supporting
+    find and the buffer protocol (bytes, mmap...)
+    :return: dict section title -> (start, end) offsets of the section content
+    in maptext, header excluded
+    """
+    if isinstance(maptext, str):
+        headers = _SECTION_HEADER.finditer(maptext)
+    else:
+        headers = _SECTION_HEADER_BYTES.finditer(maptext)
+
+    # The header must start at the beginning of a line
+    starts = []
+    for match in headers:
+        line_start = maptext.rfind(_text(maptext, '\n'), 0, match.start()) + 1
+        if not maptext[line_start:match.start()].strip():
+            title = match.group('title')
+            if not isinstance(title, str):
+                title = title.decode(ENCODING)
+            newline = '\r\n' if _text(maptext, '\r') in match.group() \
+                else '\n'
+            starts.append((title, line_start, match.end(), newline))
+
+    sections = {}
+    for n, (title, header_start, start, newline) in enumerate(starts):
+        if n + 1 < len(starts):
+            end = starts[n + 1][1]
+        else:
+            end = len(maptext)
+
+        terminator = SECTION_TERMINATORS.get(title)
+        if terminator is not None:
+            terminator = _text(maptext, terminator.replace('\n', newline))
+            terminator_pos = maptext.find(terminator, start, end)
+            if terminator_pos >= 0:
+                end = terminator_pos + len(newline)
+
+        sections.setdefault(title, (start, end))
+
+    return sections
+
+
+def iter_lines(maptext, start=0, end=None):
+    """
+    Generate the lines of maptext[start:end] without copying the whole range
+    :param maptext: map file content, str or bytes-like object (see
+    index_sections)
+    :param start: offset of the first line
+    :param end: offset of the end of the range, end of maptext if None
+    :return: generator of str lines, without line terminators
+    """
+    if end is None:
+        end = len(maptext)
+
+    newline = _text(maptext, '\n')
+    while start < end:
+        stop = maptext.find(newline, start, end)
+        if stop < 0:
+            stop = end
+        line = maptext[start:stop]
+        if not isinstance(line, str):
+            line = line.decode(ENCODING, 'replace')
+        yield line.rstrip('\r')
+        start = stop + 1
+
+
+def _lines(text):
+    """ Section content as lines, from a string or an iterable of lines """
+    if isinstance(text, str):
+        return text.split('\n')
+    return text
+
+
+def section_bounds(maptext, title, index=None):
+    """
+    Offsets of a section in map file content
+    :param maptext: map file content (see index_sections)
+    :param title: title of the section
+    :param index: result of index_sections for maptext, to share a single
+    scan between several sections. Computed if None.
+    :return: (start, end) offsets of the section content
+    """
+    if index is None:
+        index = index_sections(maptext)
+
+    try:
+        return index[title]
+    except KeyError:
+        raise ParserError("Cannot find '{}' section".format(title)) from None
+
+
+def _is_dashes(line):
+    line = line.strip()
+    return len(line) >= 3 and not line.strip('-')
+
+
+def _is_section_header(line1, line2, line3):
+    return _is_dashes(line1) and _is_dashes(line3) and \
+        bool(line2.strip()) and not _is_dashes(line2)
+
+
+def stream_section_lines(lines, title):
+    """
+    Lines of a section read from a stream of lines, e.g. a file object. The
+    stream is consumed up to the end of the section, keeping only the two
+    lines of lookahead needed to detect the section headers. If the stream
+    has a push_back method (see reader.LineStream), the lines read ahead are
+    given back so that the following sections can be read from the same
+    stream, in the order of the file.
+    :param lines: iterable of lines of the map file, with or without line
+    terminators
+    :param title: title of the section
+    :return: generator of lines, without line terminators
+    """
+    window = collections.deque(maxlen=3)
+    for line in lines:
+        window.append(line.rstrip('\r\n'))
+        if len(window) == 3 and _is_section_header(*window) and \
+                window[1].strip() == title:
+            break
+    else:
+        raise ParserError("Cannot find '{}' section".format(title))
+
+    for line in _stream_section_content(lines, title):
+        yield line
+
+
+def stream_sections(lines):
+    """
+    Sections of a stream of lines, read in a single pass in the order of the
+    file, so that a missing section doesn't consume the following ones
+    :param lines: iterable of lines of the map file, see stream_section_lines
+    :return: generator of (title, generator of the lines of the section).
+    The lines of a section must be read before the next section is
+    generated, the ones not read are skipped.
+    """
+    if not hasattr(lines, 'push_back'):
+        lines = reader.LineStream(lines)
+
+    window = collections.deque(maxlen=3)
+    for line in lines:
+        window.append(line.rstrip('\r\n'))
+        if len(window) == 3 and _is_section_header(*window):
+            title = window[1].strip()
+            content = _stream_section_content(lines, title)
+            yield title, content
+            for _ in content:
+                pass
+            window.clear()
+
+
+def _stream_section_content(lines, title):
+    """
+    Lines of a section from a stream of lines positioned after its header,
+    see stream_section_lines
+    """
+    terminator = SECTION_TERMINATORS.get(title)
+    max_blank_lines = None if terminator is None else len(terminator) - 1
+
+    # The blank lines are held back until it is known whether they end the
+    # section
+    blank_lines = []
+    content = _stream_until_header(lines)
+    try:
+        for line in content:
+            if line.strip():
+                for blank_line in blank_lines:
+                    yield blank_line
+                blank_lines = []
+                yield line
+            else:
+                blank_lines.append(line)
+                if len(blank_lines) == max_blank_lines:
+                    return
+    finally:
+        content.close()
+
+    for blank_line in blank_lines:
+        yield blank_line
+
+
+def _stream_until_header(lines):
+    """
+    Generate the lines until the next section header. Each line is yielded
+    once the two following lines are known to not start another section.
+    """
+    window = collections.deque()
+    try:
+        for line in lines:
+            window.append(line.rstrip('\r\n'))
+            if len(window) == 3:
+                if _is_section_header(*window):
+                    return
+                yield window.popleft()
+
+        while window:
+            yield window.popleft()
+    finally:
+        # Give back the lines read ahead and not consumed
+        if window and hasattr(lines, 'push_back'):
+            lines.push_back(list(window))
+
+
+def section_lines(maptext, title, index=None):
+    """
+    Lines of a section of the map file content
+    :param maptext: map file content (see index_sections), or iterable of
+    lines read in streaming (see stream_section_lines), in which case the
+    sections must be read in the order of the file
+    :param title: title of the section
+    :param index: see section_bounds, unused when streaming
+    :return: generator of lines, see iter_lines
+    """
+    if not hasattr(maptext, 'find'):
+        return stream_section_lines(maptext, title)
+    return iter_lines(maptext, *section_bounds(maptext, title, index))
+
+
+@profiled()
+def extract_segments(maptext, index=None):
     """
     Extract the segments extract from map file content
     :param maptext: map file content string
+    :param index: see section_bounds
     :return: segments extract string
     """
-    segments_header = """                               --------
-                               Segments
-                               --------
-"""
+    start, end = section_bounds(maptext, SEGMENTS, index)
+    return maptext[start:end]
 
-    start = maptext.find(segments_header)
-    if start < 0:
-        raise ParserError("Cannot find segments")
 
-    end = maptext.find("\n\n\n", start)
-    if end < 0:
-        raise ParserError("Cannot find segments")
-
-    return maptext[start + len(segments_header):end + 1]
+def _items(items):
+    """ ['key1', 'value1', 'key2', 'value2'...] -> {key1: value1...} """
+    return {items[2*n]: items[2*n+1] for n in range(len(items)//2)}
 
 
+@profiled()
 def parse_segments(segments_string, strict=True):
     """
     Parse the segments and returns a list of dictionaries of the elements
-    :param segments_string: segments as printed in the map file
+    :param segments_string: segments as printed in the map file, as a string
+    or an iterable of lines
     :param strict: if True the function raises a ParseError exception when
     incoherent data is found
     :return: list of dictionaries for each element with the following keys:
@@ -47,16 +309,23 @@ def parse_segments(segments_string, strict=True):
 
     segments_dicts = []
 
-    for line in segments_string.split('\n'):
-        if line.strip():
-            items = line.split()
-            items_d = {items[2*n]: items[2*n+1] for n in range(len(items)//2)}
+    for line in _lines(segments_string):
+        items = line.split()
+        if items:
+            if len(items) == 8 and items[0] == 'start' and \
+                    items[2] == 'end' and items[6] == 'segment':
+                name, start, end, length = items[7], items[1], items[3], \
+                    items[5]
+            else:
+                items_d = _items(items)
+                name, start, end, length = items_d['segment'], \
+                    items_d['start'], items_d['end'], items_d['length']
 
             seg = {
-                'name': items_d['segment'],
-                'start': int(items_d['start'], 16),
-                'end': int(items_d['end'], 16),
-                'length': int(items_d['length']),
+                'name': name,
+                'start': int(start, 16),
+                'end': int(end, 16),
+                'length': int(length),
             }
 
             if strict and seg['length'] != seg['end'] - seg['start']:
@@ -68,92 +337,144 @@ def parse_segments(segments_string, strict=True):
     return segments_dicts
 
 
+@profiled()
 def make_segments(segments_dict):
-    return [Segment(seg_dict['name'], seg_dict['start'], seg_dict['end'])
+    return [Segment.from_parsed(sys.intern(seg_dict['name']),
+                                seg_dict['start'], seg_dict['end'])
             for seg_dict in segments_dict]
 
 
-def get_segments(maptext):
+@profiled()
+def get_segments(maptext, index=None):
     """
     Map file content string -> list of Segment objects
-    Shortcut for make_segments(parse_segments(extract_segments(maptext)))
+    Shortcut for make_segments(parse_segments(section_lines(maptext,
+    SEGMENTS)))
     :param maptext:  map file content string
+    :param index: see section_bounds
     :return: list of Segment objects
     """
-    return make_segments(parse_segments(extract_segments(maptext)))
+    return make_segments(parse_segments(
+        section_lines(maptext, SEGMENTS, index)))
 
 
-def extract_modules(maptext):
+@profiled()
+def extract_modules(maptext, index=None):
     """
     Extract the modules from map file content
     :param maptext: map file content string
+    :param index: see section_bounds
     :return: modules extract string
     """
-    header = """-------
-                               Modules
-                               -------
-"""
-    start = maptext.find(header)
-    if start < 0:
-        raise ParserError("Cannot find modules")
+    start, end = section_bounds(maptext, MODULES, index)
+    return maptext[start:end]
 
-    end = maptext.find("\n\n\n", start)
-    if end < 0:
-        raise ParserError("Cannot find modules")
 
-    return maptext[start+len(header):end+1]
+@profiled()
+def tokenize_modules(modules_string):
+    """
+    Parse the modules into tuples. The section lines in the usual layout are
+    split at fixed positions, the other ones are read as key value pairs.
+    :param modules_string: modules as printed in the map file, as a string or
+    an iterable of lines. The modules are separated by blank lines.
+    :return: list of (module name, list of (section name, start address, end
+    address)) tuples, the addresses as integers
+    """
+    modules = []
+    sections = None
+    for line in _lines(modules_string):
+        items = line.split()
+        if not items:
+            sections = None
+        elif sections is None:
+            line = line.strip()
+            sections = []
+            modules.append((line[:line.rfind(':')], sections))
+        elif len(items) == 8 and items[0] == 'start' and items[2] == 'end' \
+                and items[6] == 'section':
+            sections.append((sys.intern(items[7]), int(items[1], 16),
+                             int(items[3], 16)))
+        else:
+            items_d = _items(items)
+            sections.append((sys.intern(items_d['section']),
+                             int(items_d['start'], 16),
+                             int(items_d['end'], 16)))
 
+    return modules
 
-def parse_modules(modules_string):
-    blocs = [[line.strip() for line in bloc.splitlines() if line.strip()]
-             for bloc in modules_string.split('\n\n')]
 
+@profiled()
+def parse_modules(modules_string):
+    """
+    Parse the modules and returns a list of dictionaries of the elements
+    :param modules_string: modules as printed in the map file, as a string or
+    an iterable of lines. The modules are separated by blank lines.
+    :return: list of dictionaries for each module with the following keys:
+        - name: of the module
+        - sections: list of dictionaries of the items of the section lines
+    """
     modules = []
-    for bloc in blocs:
-        module = {'name': bloc[0][:bloc[0].rfind(':')], 'sections': []}
-        for line in bloc[1:]:
-            items = line.split()
-            items_d = {items[2*n]: items[2*n+1] for n in range(len(items)//2)}
-            module['sections'].append(items_d)
-        modules.append(module)
+    module = None
+    for line in _lines(modules_string):
+        line = line.strip()
+        if not line:
+            module = None
+        elif module is None:
+            module = {'name': line[:line.rfind(':')], 'sections': []}
+            modules.append(module)
+        else:
+            module['sections'].append(_items(line.split()))
 
     return modules
 
 
-def make_modules(modules_dicts):
+@profiled()
+def make_modules(modules_elements):
+    """
+    :param modules_elements: tuples given by tokenize_modules, or
+    dictionaries given by parse_modules
+    :return: list of Module objects
+    """
+    # The addresses are unsigned hexadecimal numbers in the map file so int()
+    # is all the validation they need. The section names repeat a lot so they
+    # are interned.
     modules = []
-    for module_dict in modules_dicts:
-        segments = [Segment(s['section'], s['start'], s['end'])
-                    for s in module_dict['sections']]
-        modules.append(Module(module_dict['name'], segments))
+    for element in modules_elements:
+        if isinstance(element, dict):
+            element = (element['name'],
+                       [(sys.intern(s['section']), int(s['start'], 16),
+                         int(s['end'], 16))
+                        for s in element['sections']])
+        name, sections = element
+        segments = [Segment.from_parsed(section, start, end)
+                    for section, start, end in sections]
+        modules.append(Module.from_parsed(name, segments))
 
     return modules
 
 
-def get_modules(maptext):
-    return make_modules(parse_modules(extract_modules(maptext)))
+@profiled()
+def get_modules(maptext, index=None):
+    """
+    Map file content string -> list of Module objects
+    :param maptext:  map file content string
+    :param index: see section_bounds
+    :return: list of Module objects
+    """
+    return make_modules(tokenize_modules(
+        section_lines(maptext, MODULES, index)))
 
 
-def extract_call_tree(maptext):
+@profiled()
+def extract_call_tree(maptext, index=None):
     """
     Extract the call tree from map file content
     :param maptext: map file content string
+    :param index: see section_bounds
     :return: call tree string
     """
-    call_tree_header = """                              ---------
-                              Call tree
-                              ---------
-"""
-
-    start = maptext.find(call_tree_header)
-    if start < 0:
-        raise ParserError("Cannot find call tree")
-
-    end = maptext.find("\n\n\n\n", start)
-    if end < 0:
-        raise ParserError("Cannot find call tree")
-
-    return maptext[start+len(call_tree_header):end+1]
+    start, end = section_bounds(maptext, CALL_TREE, index)
+    return maptext[start:end]
 
 
 CALL_TREE_REGEX = re.compile(r"""
@@ -170,139 +491,342 @@ CALL_TREE_REGEX = re.compile(r"""
 """, flags=re.VERBOSE)
 
 
+# Fields of the tuples given by tokenize_call_tree
+CALL_TREE_FIELDS = ('index', 'level', 'func_name', 'size', 'ref', 'ellipsis')
+
+# Marks of the call tree levels, '>' is the mark of the roots
+_LEVEL_MARKS = frozenset(['|', '+', '>'])
+
+
+def _call_tree_token(line):
+    """ Call tree line -> tuple, with CALL_TREE_REGEX, None if no match """
+    match = CALL_TREE_REGEX.search(line)
+    if match is None:
+        return None
+
+    index, level, name, size, ref, ellipsis = match.group(
+        'index', 'level', 'func_name', 'size', 'ref', 'ellipsis')
+    return (int(index), level.count('|') + level.count('+'), name,
+            None if size is None else int(size),
+            None if ref is None else int(ref),
+            ellipsis is not None)
+
+
+def _fast_call_tree_token(parts):
+    """
+    Split call tree line -> tuple, for the usual layouts:
+        <index> <level marks> <name>: (<size>)
+        <index> <level marks> <name> --> <index>
+        <index> <level marks> (<name>) ...
+    None for the other lines
+    """
+    if len(parts) < 3 or not parts[0].isdigit():
+        return None
+
+    position = 1
+    level = 0
+    while position < len(parts) and parts[position] in _LEVEL_MARKS:
+        if parts[position] != '>':
+            level += 1
+        position += 1
+
+    tail = len(parts) - position
+    if tail == 2 and parts[-1] == '...':
+        name, size, ref = parts[-2], None, None
+        if name[:1] == '(':
+            name = name[1:]
+        if name[-1:] == ')':
+            name = name[:-1]
+    elif tail == 2 and parts[-2][-1:] == ':' and parts[-1][:1] == '(' and \
+            parts[-1][-1:] == ')' and parts[-1][1:-1].isdigit():
+        name, size, ref = parts[-2][:-1], int(parts[-1][1:-1]), None
+    elif tail == 3 and parts[-2] == '-->' and parts[-1].isdigit():
+        name, size, ref = parts[-3], None, int(parts[-1])
+    else:
+        return None
+
+    # Odd names are left to the regex
+    if not name or name[0] in _LEVEL_MARKS or name[0] == '(' or \
+            ':' in name or ')' in name:
+        return None
+
+    return int(parts[0]), level, name, size, ref, size is None and ref is None
+
+
+@profiled()
+def tokenize_call_tree(call_tree_string):
+    """
+    Parse the call tree into tuples. The lines in the usual layout are split
+    at the blanks, the other ones are matched with CALL_TREE_REGEX.
+    :param call_tree_string: call tree as printed in the map file, as a
+    string or an iterable of lines
+    :return: list of (index, level, func_name, size, ref, ellipsis) tuples,
+    see parse_call_tree for the fields. The element of index n is at
+    position n - 1.
+    """
+    tokens = []
+    for line in _lines(call_tree_string):
+        parts = line.split()
+        if not parts:
+            continue
+        token = _fast_call_tree_token(parts)
+        if token is None:
+            token = _call_tree_token(line)
+            if token is None:
+                continue
+
+        # For now it just raise an exception at the first non-matching case,
+        # consider adding an attempt to fix it if necessary
+        if token[0] != len(tokens) + 1:
+            raise ParserError("Index {} doesn't match position {}".format(
+                token[0], len(tokens) + 1))
+        tokens.append(token)
+
+    return tokens
+
+
+@profiled()
 def parse_call_tree(call_tree_string):
     """
     Parse the call tree and returns a list of dictionaries of the elements
-    :param call_tree_string: call tree as printed in the map file
-    :return: list of dictionaries for each element with the following keys:
+    :param call_tree_string: call tree as printed in the map file, as a
+    string or an iterable of lines
+    :return: list of dictionaries for each element with the following keys,
+    preceded by None so that the position of an element is its index:
         - index: index of the element as printed
         - func_name: name of the function
         - level: level of indentation denoting the call hierarchy, root is 0
         - size and ref: only one is defined, the other is None. When defined,
         size is the stack size of the function, ref is the index at which the
         size is given
+        - ellipsis: True if the calls of the function are not printed
     """
-    # dict(index, func_name, level, size, ref, ellipsis)
-
-    call_tree_dicts = []
-
-    # For each match, get and normalize its dict, and store in list
-    for match in re.finditer(CALL_TREE_REGEX, call_tree_string):
-        element = match.groupdict()
-
-        # Normalize values to int
-
-        for key in ('index', 'size', 'ref'):
-            try:
-                element[key] = int(element[key])
-            except (ValueError, TypeError):
-                pass
-
-        level = element['level']
-        element['level'] = level.count('|') + level.count('+')
-
-        element['ellipsis'] = bool(element['ellipsis'])
-
-        call_tree_dicts.append(element)
-
-    # Check the matching of 'index' attribute with the position in the list
-    # For now it just raise an exception at the first non-matching case,
-    # consider adding an attempt to fix it if necessary
-    # The first index is 1 so we start to push a None in position 0
-    call_tree_dicts.insert(0, None)
-    for position, element in enumerate(call_tree_dicts):
-        if element is not None and element['index'] != position:
-            raise ParserError("Index {} doesn't match position {}".format(
-                element['index'], position))
-
-    return call_tree_dicts
+    return [None] + [dict(zip(CALL_TREE_FIELDS, token))
+                     for token in tokenize_call_tree(call_tree_string)]
 
 
+@profiled()
 def make_call_tree(elements):
+    """
+    :param elements: tuples given by tokenize_call_tree, or dictionaries
+    given by parse_call_tree
+    :return: CallTree object
+    """
+    elements = [tuple(element[field] for field in CALL_TREE_FIELDS)
+                if isinstance(element, dict) else element
+                for element in elements if element is not None]
     call_tree = CallTree()
 
-    for element in elements:
-        if element is not None and element['size'] is not None:
-            call_tree.add_function(element['func_name'], element['size'])
+    for _, _, name, size, _, _ in elements:
+        if size is not None:
+            call_tree.add_function(name, size)
 
+    # Callers of the current element, by level
     call_stack = []
-    for element in elements:
-        if element is not None:
-            call_stack_delta = 1 + element['level'] - len(call_stack)
-            if element['level'] == 0:
-                call_stack = [element]
-                call_tree.connect(element['func_name'], None)
-            else:
-                call_tree.connect(element['func_name'],
-                                  call_stack[call_stack_delta-2]['func_name'])
-                for pop_num in range(1 - call_stack_delta):
-                    call_stack.pop()
-                call_stack.append(element)
+    for _, level, name, _, _, _ in elements:
+        if level == 0:
+            call_tree.connect(name, None)
+        else:
+            call_tree.connect(name, call_stack[level - 1])
+        del call_stack[level:]
+        call_stack.append(name)
     return call_tree
 
 
-def get_call_tree(maptext):
+@profiled()
+def get_call_tree(maptext, index=None):
     """
     Map file content string -> CallTree object
-    Shortcut for make_call_tree(parse_call_tree(extract_call_tree(maptext)))
+    Shortcut for make_call_tree(tokenize_call_tree(section_lines(maptext,
+    CALL_TREE)))
     :param maptext:  map file content string
+    :param index: see section_bounds
     :return: CallTree object
     """
-    return make_call_tree(parse_call_tree(extract_call_tree(maptext)))
+    return make_call_tree(tokenize_call_tree(
+        section_lines(maptext, CALL_TREE, index)))
 
 
-def extract_symbols(maptext):
+@profiled()
+def extract_symbols(maptext, index=None):
     """
     Extract the symbols section from map file content
     :param maptext: map file content string
+    :param index: see section_bounds
     :return: symbol section of the map file as string
     """
-    symbols_header = """                               -------
-                               Symbols
-                               -------
-"""
+    start, end = section_bounds(maptext, SYMBOLS, index)
+    return maptext[start:end]
 
-    start = maptext.find(symbols_header)
-    if start < 0:
-        raise ParserError("Cannot find 'Symbols' section")
 
-    return maptext[start + len(symbols_header):]
+def _parse_definition(definition):
+    """
+    'defined in <module> [section <section> [(<output section>)]]' ->
+    (module, section), section being None when not given
+    """
+    if not definition.startswith('defined in '):
+        return None
+    definition = definition[len('defined in '):]
 
+    position = definition.rfind(' section ')
+    if position < 0:
+        if definition.startswith('section '):  # no module
+            return None, definition[len('section '):].split()[0]
+        return definition.strip(), None
 
-SYMBOL_REGEX = re.compile(r"""    (?P<name>\w+)
-    \s+
-    (?P<address>[0-9a-fA-F]+)
-    \s+
-    defined\ in\ 
-    (?P<module_defined>.+?)
-    \s*
-    (?:section\ 
-        (?P<section>.+?)(?:\ \((?P<section2>.+?)\).*?(?P<init>initialized)?)?
-    )?
-    \n\s*
-    (?:
-        (?:used\ in\ (?P<module_used>.+(?:\n\s+.+)*\n)+?)
-        |
-        (?:(?P<not_used>\*\*\*\ not\ used\ \*\*\*)\n)
-    )?""", flags=re.VERBOSE)
+    return (definition[:position].strip(),
+            definition[position + len(' section '):].split()[0])
 
 
+@profiled()
 def parse_symbols(symbols_string):
     """
-    Parse the symbols section and returns a list of dictionaries of the elements
-    :param symbols_string: symbols as printed in the map file
-    :return:
+    Parse the symbols section and returns a list of dictionaries of the
+    elements. Single pass over the lines, in linear time.
+    :param symbols_string: symbols as printed in the map file, as a string or
+    an iterable of lines
+    :return: list of dictionaries for each symbol with the following keys:
+        - name: of the symbol
+        - address: of the symbol as integer
+        - module: where the symbol is defined, None if not given
+        - section: where the symbol is defined, None if not given
+        - used_in: list of the modules using the symbol
     """
-
     symbols_dicts = []
-
-    # For each match, get and normalize its dict, and store in list
-    for match in re.finditer(SYMBOL_REGEX, symbols_string):
-        element = match.groupdict()
-        # TODO: finish
-        print(element)
-        symbols_dicts.append(element)
+    symbol = None
+
+    for line in _lines(symbols_string):
+        if not line.strip():
+            continue
+
+        if not line[0].isspace():
+            # First line of a symbol: name, address and definition
+            items = line.split(None, 2)
+            definition = None if len(items) < 3 else \
+                _parse_definition(items[2])
+            if definition is None:
+                raise ParserError("Invalid symbol line: '{}'".format(line))
+            try:
+                address = int(items[1], 16)
+            except ValueError:
+                raise ParserError("Invalid symbol address: '{}'".format(line))
+
+            symbol = {'name': items[0], 'address': address,
+                      'module': definition[0], 'section': definition[1],
+                      'used_in': []}
+            symbols_dicts.append(symbol)
+
+        elif symbol is not None:
+            # Following lines: the modules using the symbol, one per line
+            line = line.strip()
+            if line.startswith('used in '):
+                symbol['used_in'].append(line[len('used in '):].strip())
+            elif line != '*** not used ***':
+                symbol['used_in'].append(line)
 
     return symbols_dicts
 
 
+def _intern(name):
+    return None if name is None else sys.intern(name)
+
+
+@profiled()
+def make_symbols(symbols_dicts):
+    # The module and section names repeat a lot so they are interned
+    symbols = [Symbol.from_parsed(s['name'], s['address'],
+                                  _intern(s['module']), _intern(s['section']),
+                                  [sys.intern(m) for m in s['used_in']])
+               for s in symbols_dicts]
+    return SymbolTable(symbols)
+
+
+@profiled()
+def get_symbols(maptext, index=None):
+    """
+    Map file content string -> SymbolTable object
+    Shortcut for make_symbols(parse_symbols(section_lines(maptext, SYMBOLS)))
+    :param maptext:  map file content string
+    :param index: see section_bounds
+    :return: SymbolTable object
+    """
+    return make_symbols(parse_symbols(section_lines(maptext, SYMBOLS, index)))
+
+
+# Section of each getter, for the parsing of the sections in parallel
+GETTER_SECTIONS = {
+    'get_segments': SEGMENTS,
+    'get_modules': MODULES,
+    'get_call_tree': CALL_TREE,
+    'get_symbols': SYMBOLS
+}
+
+# A symbol record starts with a line which doesn't start with a blank
+_RECORD_START = re.compile(r'\n(?=\S)')
+_RECORD_START_BYTES = re.compile(br'\n(?=\S)')
+
+
+def split_section(maptext, title, chunks=1, index=None):
+    """
+    Split a section into ranges which can be parsed independently: the
+    symbols section is split at record boundaries, the other sections are not
+    split
+    :param maptext: map file content (see index_sections)
+    :param chunks: number of ranges wanted for the symbols section
+    :param index: see section_bounds
+    :return: list of (start, end) offsets
+    """
+    start, end = section_bounds(maptext, title, index)
+    if title != SYMBOLS or chunks <= 1:
+        return [(start, end)]
+
+    record_start = _RECORD_START if isinstance(maptext, str) \
+        else _RECORD_START_BYTES
+    ranges = []
+    step = (end - start) // chunks + 1
+    while start < end:
+        match = record_start.search(maptext, min(start + step, end), end)
+        stop = end if match is None else match.start() + 1
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def parse_lines(title, lines):
+    """
+    Parse the lines of a section
+    :param title: title of the section
+    :param lines: iterable of the lines of the section content
+    :return: list of Segment objects, list of Module objects, CallTree object
+    or SymbolTable object according to the section
+    """
+    if title == SEGMENTS:
+        return make_segments(parse_segments(lines))
+    elif title == MODULES:
+        return make_modules(tokenize_modules(lines))
+    elif title == CALL_TREE:
+        return make_call_tree(tokenize_call_tree(lines))
+    elif title == SYMBOLS:
+        return make_symbols(parse_symbols(lines))
+    raise ValueError("Unknown section '{}'".format(title))
+
+
+def parse_range(path, title, start, end):
+    """
+    Parse a range of a section of a map file, given by split_section. Can run
+    in a worker process.
+    :return: see parse_lines, a list of Symbol objects for the symbols
+    """
+    with reader.open_map(path) as maptext:
+        parsed = parse_lines(title, iter_lines(maptext, start, end))
+    if title == SYMBOLS:
+        return parsed.symbols
+    return parsed
+
+
+def merge_ranges(title, results):
+    """ Parsed object of a section from the results of parse_range """
+    if title == SYMBOLS:
+        return SymbolTable([symbol for symbols in results
+                            for symbol in symbols])
+    return results[0]
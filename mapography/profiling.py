@@ -0,0 +1,173 @@
+# coding: utf-8
+
+"""
+Profiling of the pipeline stages: wall time, number of calls and optionally
+peak memory of each stage.
+
+The parser and command modules mark their stages with the stage context
+manager or the profiled decorator, which do nothing unless a profiler is
+active:
+
+    with profiling.Profiler(memory=True) as profiler:
+        ...
+    print(profiler.report())
+
+The stages are nested, a stage is named by the names of the enclosing stages
+and its own, joined by '/'. The stages run in other processes (batch mode,
+parallel diff) are not recorded.
+"""
+
+import json
+import time
+import functools
+import contextlib
+import tracemalloc
+
+# Profiler recording the stages, None when not profiling
+_active = None
+
+
+class StageStats(object):
+    """ Measures of a stage, cumulated over its calls """
+
+    __slots__ = ('name', 'calls', 'seconds', 'peak_bytes')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.peak_bytes = None
+
+    def as_dict(self):
+        return {'stage': self.name, 'calls': self.calls,
+                'seconds': self.seconds, 'peak_bytes': self.peak_bytes}
+
+
+class Profiler(object):
+    """
+    Records the stages run while it is active, as a context manager
+    """
+
+    def __init__(self, memory=False):
+        """
+        :param memory: measure the peak memory allocated in each stage with
+        tracemalloc, which slows down the run
+        """
+        self.memory = memory
+        self.stats = {}  # stage name -> StageStats, in order of first call
+        self._names = []  # names of the stages being run
+        # Memory allocated when the stages being run started, and highest
+        # peak of their finished substages
+        self._memory = []
+        self._previous = None
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        _active = self
+        if self.memory:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        if self.memory:
+            tracemalloc.stop()
+        _active = self._previous
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self._names.append(name)
+        full_name = '/'.join(self._names)
+        stats = self.stats.get(full_name)
+        if stats is None:
+            stats = self.stats[full_name] = StageStats(full_name)
+
+        if self.memory:
+            # The tracemalloc peak is global: it is reset for this stage and
+            # the peak seen by the enclosing stage is kept aside
+            current, peak = tracemalloc.get_traced_memory()
+            if self._memory:
+                self._memory[-1][1] = max(self._memory[-1][1], peak)
+            self._memory.append([current, 0])
+            tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.seconds += time.perf_counter() - start
+            stats.calls += 1
+            self._names.pop()
+
+            if self.memory:
+                start_memory, substages_peak = self._memory.pop()
+                peak = max(tracemalloc.get_traced_memory()[1], substages_peak)
+                stats.peak_bytes = max(stats.peak_bytes or 0,
+                                       peak - start_memory)
+                if self._memory:
+                    self._memory[-1][1] = max(self._memory[-1][1], peak)
+
+    def results(self):
+        """ List of the stage measures as dicts, in order of first call """
+        return [stats.as_dict() for stats in self.stats.values()]
+
+    def report(self):
+        """ Text table of the stage measures """
+        width = max([len(name) for name in self.stats] + [len('stage')])
+        line_format = '{:<' + str(width) + '} {:>6} {:>10} {:>11}'
+        lines = [line_format.format('stage', 'calls', 'time (ms)',
+                                    'peak (KiB)')]
+        for stats in self.stats.values():
+            lines.append(line_format.format(
+                stats.name, stats.calls,
+                '{:.2f}'.format(stats.seconds * 1000),
+                '' if stats.peak_bytes is None
+                else '{:.0f}'.format(stats.peak_bytes / 1024)))
+        return '\n'.join(lines)
+
+    def json(self):
+        return json.dumps(self.results(), indent=2)
+
+
+def stage(name):
+    """
+    Context manager marking a stage of the active profiler, does nothing if
+    there is none
+    """
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.stage(name)
+
+
+def profiled(name=None):
+    """
+    Decorator making a stage of each call of the function
+    :param name: stage name, the function name by default
+    """
+    def decorator(func):
+        stage_name = func.__name__ if name is None else name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with _active.stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def profiled_iterator(iterator, name):
+    """
+    Generator making a stage of the production of each item of iterator,
+    for the commands returning their lines lazily
+    """
+    iterator = iter(iterator)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
@@ -0,0 +1,160 @@
+# coding: utf-8
+
+import io
+import bz2
+import gzip
+import lzma
+import mmap
+import contextlib
+
+from mapography import profiling
+
+# Input modes
+MMAP = 'mmap'  # memory mapped file, the OS pages it in and out as needed
+STREAM = 'stream'  # file object read line by line, single pass only
+READ = 'read'  # whole file read in memory as a str
+AUTO = 'auto'  # STREAM for the compressed files, MMAP for the others
+
+INPUT_MODES = (MMAP, STREAM, READ, AUTO)
+
+ENCODING = 'utf-8'
+
+# Compressions of the map files, recognized by the magic bytes at the start
+# of the file
+GZIP = 'gzip'
+BZIP2 = 'bzip2'
+XZ = 'xz'
+ZSTD = 'zstd'
+
+_MAGIC_BYTES = [
+    (b'\x1f\x8b', GZIP),
+    (b'BZh', BZIP2),
+    (b'\xfd7zXZ\x00', XZ),
+    (b'\x28\xb5\x2f\xfd', ZSTD)
+]
+
+
+def compression(path):
+    """
+    Compression of a file, from its first bytes
+    :return: one of GZIP, BZIP2, XZ, ZSTD, None if the file is not compressed
+    """
+    with open(path, 'rb') as f:
+        start = f.read(max(len(magic) for magic, _ in _MAGIC_BYTES))
+    for magic, name in _MAGIC_BYTES:
+        if start.startswith(magic):
+            return name
+    return None
+
+
+def _open_zstd(path):
+    try:
+        from compression import zstd  # Python 3.14
+    except ImportError:
+        pass
+    else:
+        return zstd.open(path, 'rb')
+
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading the zstd compressed file '{}' requires "
+                          "the zstandard module".format(path))
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(
+        open(path, 'rb'), read_across_frames=True, closefd=True))
+
+
+def open_binary(path):
+    """
+    Open a file for reading in binary mode, the compressed files (see
+    compression) are decompressed on the fly as they are read
+    :return: binary file object
+    """
+    name = compression(path)
+    if name == GZIP:
+        return gzip.open(path, 'rb')
+    elif name == BZIP2:
+        return bz2.open(path, 'rb')
+    elif name == XZ:
+        return lzma.open(path, 'rb')
+    elif name == ZSTD:
+        return _open_zstd(path)
+    return open(path, 'rb')
+
+
+class LineStream(object):
+    """
+    Iterator of the lines of a file, read one at a time. The lines read in
+    advance by a section parser can be pushed back to be read again by the
+    next one.
+    """
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._pushed_back = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._pushed_back:
+            return self._pushed_back.pop()
+        return next(self._lines)
+
+    def push_back(self, lines):
+        """ Give back lines, the first of the list will be read first """
+        self._pushed_back.extend(reversed(lines))
+
+
+@contextlib.contextmanager
+def open_map(path, mode=MMAP):
+    """
+    Open a map file for the parsers, the file is closed when leaving the
+    context. The compressed files (see compression) are decompressed as they
+    are read, except in MMAP mode where the whole decompressed content is
+    read in memory.
+    :param path: path of the map file
+    :param mode: one of INPUT_MODES
+    :return: context manager giving the map content: a read-only mmap (bytes
+    if the file is compressed) in MMAP mode, a LineStream in STREAM mode, a
+    str in READ mode
+    """
+    compressed = compression(path) is not None
+    if mode == AUTO:
+        mode = STREAM if compressed else MMAP
+
+    if mode == MMAP and compressed:
+        # A compressed file can't be mapped, its decompressed content is read
+        # in memory as bytes, which the parsers use like a mmap
+        with open_binary(path) as f:
+            with profiling.stage('read'):
+                data = f.read()
+        yield data
+
+    elif mode == MMAP:
+        with open(path, 'rb') as f:
+            try:
+                with profiling.stage('read'):
+                    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                yield b''
+            else:
+                try:
+                    yield buffer
+                finally:
+                    buffer.close()
+
+    elif mode == STREAM:
+        with io.TextIOWrapper(open_binary(path), encoding=ENCODING,
+                              errors='replace') as f:
+            yield LineStream(f)
+
+    elif mode == READ:
+        with io.TextIOWrapper(open_binary(path), encoding=ENCODING,
+                              errors='replace') as f:
+            with profiling.stage('read'):
+                text = f.read()
+            yield text
+
+    else:
+        raise ValueError("Unknown input mode '{}'".format(mode))
@@ -0,0 +1,318 @@
+# coding: utf-8
+
+"""
+Server mode: a long-running process keeping the parsed maps in memory, to
+answer the commands with a low latency. A map is parsed on its first query
+and reparsed when its file changes, the least recently used maps are evicted.
+
+The protocol is JSON Lines over TCP on localhost or a Unix socket: a request
+is {"args": [mapography arguments], "cwd": client directory, "stdin": text},
+the arguments being the ones of the mapography command line and the optional
+text being the standard input of the commands which read it, and the
+response is {"result": command output} or {"error": message}. A connection
+can send several requests, they are answered in order.
+
+Usage example:
+python -m mapography.server serve --port 8765 &
+python -m mapography.server query --port 8765 cosmic calls longest big.map
+"""
+
+import io
+import os
+import sys
+import json
+import socket
+import asyncio
+import argparse
+import threading
+import contextlib
+import collections
+
+from mapography import mapfile, reader
+from mapography.__main__ import PARSERS, _options
+from mapography.__main__ import make_argparser as make_command_argparser
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_MAPS = 8
+
+# Destinations of the arguments which are file paths, relative to the
+# directory of the client
+_PATH_ARGS = ('i', 'base', 'address_file')
+
+# Commands which can't run on the server: they write files on its side
+_UNSUPPORTED = [('export', 'columnar')]
+
+# Commands reading the standard input when a file option is not given:
+# (command, subcommand) -> (file option, option of the text read instead)
+_STDIN_COMMANDS = {
+    ('lookup', 'addresses'): ('address_file', 'address_text')
+}
+
+
+class HelpRequested(Exception):
+    """ Raised by parse_request_args for -h, with the help text """
+
+
+class ResidentMap(object):
+    """
+    A map file content and its parsed objects, memoized by a MapFile. The
+    lock serializes the commands on the map, which share the memoized
+    objects.
+    """
+
+    def __init__(self, parser, path):
+        self.stamp = _stamp(path)
+        # Read in memory rather than mapped: the file can be rewritten while
+        # it is resident
+        self.map_file = mapfile.MapFile(path, parser, reader.READ)
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.map_file.close()
+
+
+def _stamp(path):
+    """ Modification time and size of a file, changed by a rewrite """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class MapStore(object):
+    """ Least recently used ResidentMap objects, by parser and path """
+
+    def __init__(self, max_maps=DEFAULT_MAX_MAPS):
+        self.max_maps = max_maps
+        self.maps = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, parser_name, path):
+        """ ResidentMap of a file, loaded again if the file changed """
+        key = parser_name, os.path.realpath(path)
+        stamp = _stamp(path)
+        with self.lock:
+            resident = self.maps.get(key)
+            if resident is not None and resident.stamp == stamp:
+                self.maps.move_to_end(key)
+                return resident
+
+        resident = ResidentMap(PARSERS[parser_name], path)
+        with self.lock:
+            # The content of a closed map is still in memory for the
+            # commands running on it
+            old = self.maps.get(key)
+            if old is not None:
+                old.close()
+            self.maps[key] = resident
+            self.maps.move_to_end(key)
+            while len(self.maps) > self.max_maps:
+                self.maps.popitem(last=False)[1].close()
+        return resident
+
+
+def parse_request_args(arguments, cwd=None):
+    """
+    Parse mapography command line arguments
+    :return: argparse namespace
+    :raise ValueError: if the arguments are invalid, with the argparse
+    message
+    :raise HelpRequested: if the arguments ask for the help
+    """
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            args = make_command_argparser().parse_args(arguments)
+    except SystemExit as e:
+        if not e.code:
+            raise HelpRequested(stdout.getvalue().rstrip('\n'))
+        raise ValueError(stderr.getvalue().strip().splitlines()[-1])
+
+    if cwd is not None:
+        for name in _PATH_ARGS:
+            value = getattr(args, name, None)
+            if value is not None:
+                setattr(args, name, os.path.join(cwd, value))
+    return args
+
+
+def reads_stdin(args):
+    """ True if the command of the arguments reads the standard input """
+    options = _STDIN_COMMANDS.get((args.command, args.subcommand))
+    return options is not None and getattr(args, options[0]) is None
+
+
+def run_command(store, args, stdin=None):
+    """
+    Run a command on a resident map, the output is returned as a str
+    :param stdin: text given to the commands which read the standard input,
+    the server doesn't read its own
+    :raise ValueError: if the command reads the standard input and stdin is
+    None, or if it writes files
+    """
+    if (args.command, args.subcommand) in _UNSUPPORTED:
+        raise ValueError("'{} {}' can't run on the server".format(
+            args.command, args.subcommand))
+
+    options = _options(args)
+    if reads_stdin(args):
+        if stdin is None:
+            raise ValueError("'{} {}' reads the standard input, which the "
+                             "request doesn't give".format(args.command,
+                                                           args.subcommand))
+        options[_STDIN_COMMANDS[(args.command, args.subcommand)][1]] = stdin
+
+    resident = store.get(args.p, args.i)
+    with resident.lock:
+        result = resident.map_file.run(args.command, args.subcommand,
+                                       **options)
+        if not isinstance(result, str):
+            result = '\n'.join(result)
+    return result
+
+
+class Server(object):
+    def __init__(self, max_maps=DEFAULT_MAX_MAPS):
+        self.store = MapStore(max_maps)
+
+    async def answer(self, request):
+        try:
+            request = json.loads(request)
+            args = parse_request_args(request['args'], request.get('cwd'))
+            # The commands run in threads so that a long parse doesn't
+            # block the other clients
+            result = await asyncio.get_running_loop().run_in_executor(
+                None, run_command, self.store, args, request.get('stdin'))
+        except HelpRequested as e:
+            return {'result': str(e)}
+        except Exception as e:
+            return {'error': '{}: {}'.format(e.__class__.__name__, e)}
+        return {'result': result}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                response = await self.answer(request)
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix=None,
+                    started=None):
+        """
+        :param unix: path of a Unix socket to listen to instead of TCP
+        :param started: callback called when the server listens
+        """
+        # Responses can be much bigger than the default limit of 64 KiB
+        if unix is not None:
+            server = await asyncio.start_unix_server(self.handle, unix,
+                                                     limit=2 ** 26)
+        else:
+            server = await asyncio.start_server(self.handle, host, port,
+                                                limit=2 ** 26)
+        async with server:
+            if started is not None:
+                started(server)
+            await server.serve_forever()
+
+
+class Client(object):
+    """ Blocking client of the server, one connection for many queries """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix=None):
+        if unix is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(unix)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile('rwb')
+
+    def query(self, arguments, cwd=None, stdin=None):
+        """
+        Run a command on the server
+        :param arguments: mapography command line arguments
+        :param cwd: directory of the relative paths, current one by default
+        :param stdin: standard input of the command, for the commands which
+        read it (see reads_stdin)
+        :return: the command output
+        :raise RuntimeError: with the error message of the server
+        """
+        request = {'args': list(arguments),
+                   'cwd': os.getcwd() if cwd is None else cwd}
+        if stdin is not None:
+            request['stdin'] = stdin
+        self.file.write(json.dumps(request).encode('utf-8') + b'\n')
+        self.file.flush()
+        response = json.loads(self.file.readline())
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def make_argparser():
+    argparser = argparse.ArgumentParser(prog='mapography.server')
+    subargparsers = argparser.add_subparsers(dest='action', metavar='action')
+    subargparsers.required = True
+
+    serve = subargparsers.add_parser('serve', help='Run the server')
+    serve.add_argument('--max-maps', type=int, default=DEFAULT_MAX_MAPS,
+                       help='Number of parsed maps kept in memory '
+                            '(default {})'.format(DEFAULT_MAX_MAPS))
+    query = subargparsers.add_parser(
+        'query', help='Run a command on the server, with the arguments of '
+                      'mapography')
+    query.add_argument('arguments', nargs=argparse.REMAINDER,
+                       help='mapography arguments')
+
+    for subargparser in (serve, query):
+        subargparser.add_argument('--host', default=DEFAULT_HOST)
+        subargparser.add_argument('--port', type=int, default=DEFAULT_PORT)
+        subargparser.add_argument('--unix', metavar='SOCKET',
+                                  help='Unix socket path, instead of TCP')
+
+    return argparser
+
+
+def execute(args):
+    if args.action == 'serve':
+        server = Server(args.max_maps)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    # The standard input is read here and sent with the request
+    stdin = None
+    try:
+        if reads_stdin(parse_request_args(args.arguments)):
+            stdin = sys.stdin.read()
+    except (ValueError, HelpRequested):
+        pass  # the server gives the error or the help
+
+    with Client(args.host, args.port, args.unix) as client:
+        try:
+            print(client.query(args.arguments, stdin=stdin))
+        except RuntimeError as e:
+            sys.stderr.write('{}\n'.format(e))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(execute(make_argparser().parse_args(sys.argv[1:])))
@@ -0,0 +1,151 @@
+# coding: utf-8
+
+"""
+Watch mode: run a command each time the map file changes and print the
+changes of its output. The sections of the map are hashed, only the changed
+ones are parsed again.
+"""
+
+import os
+import sys
+import time
+import difflib
+import hashlib
+
+from mapography import reader
+
+
+class IncrementalParser(object):
+    """
+    Wrapper of a parser module whose get_* functions return the objects
+    parsed from the previous content of the map, as long as their section
+    didn't change. It can be given to the commands in place of the parser.
+    """
+
+    def __init__(self, parser):
+        """
+        :param parser: parser module, with GETTER_SECTIONS
+        """
+        self.parser = parser
+        self.hashes = {}  # section title -> hash of its content
+        self.index = None
+        self.results = {}  # getter name -> parsed object
+
+    def update(self, maptext):
+        """
+        Take a new content of the map, forget the objects parsed from the
+        sections which changed
+        :param maptext: map file content, str or bytes
+        :return: sorted list of the titles of the sections which changed
+        """
+        self.index = self.parser.index_sections(maptext)
+        data = maptext if isinstance(maptext, bytes) else \
+            maptext.encode('utf-8')
+        view = memoryview(data)
+
+        hashes = {}
+        for title, (start, end) in self.index.items():
+            hashes[title] = hashlib.sha1(view[start:end]).digest()
+        changed = sorted(title for title in set(hashes) | set(self.hashes)
+                         if hashes.get(title) != self.hashes.get(title))
+        self.hashes = hashes
+
+        for name, title in self.parser.GETTER_SECTIONS.items():
+            if title in changed:
+                self.results.pop(name, None)
+        return changed
+
+    def _get(self, name, maptext):
+        if name not in self.results:
+            self.results[name] = getattr(self.parser, name)(maptext,
+                                                             self.index)
+        return self.results[name]
+
+    def __getattr__(self, name):
+        if name in self.parser.GETTER_SECTIONS:
+            return lambda maptext, index=None: self._get(name, maptext)
+        return getattr(self.parser, name)
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None  # being written by the linker
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _lines(result):
+    if isinstance(result, str):
+        return result.split('\n')
+    return list(result)
+
+
+def watch(path, parser, func, options=None, interval=1.0, count=None):
+    """
+    Run a command on a map file each time it changes: the first output is
+    given whole, the next ones as a diff with the previous one
+    :param path: map file path
+    :param parser: parser module
+    :param func: command function
+    :param options: keyword arguments of the command
+    :param interval: polling period in seconds
+    :param count: number of runs of the command before returning, None to
+    watch forever
+    :return: generator of the output lines
+    """
+    incremental = IncrementalParser(parser)
+    options = {} if options is None else options
+    previous_stamp = None
+    previous_lines = None
+    missing = False
+    runs = 0
+
+    while count is None or runs < count:
+        stamp = _stamp(path)
+        if stamp is None and not missing:
+            sys.stderr.write('{}: missing, waiting for it\n'.format(path))
+            sys.stderr.flush()
+        missing = stamp is None
+        if stamp is None or stamp == previous_stamp:
+            time.sleep(interval)
+            continue
+        previous_stamp = stamp
+
+        try:
+            with reader.open_binary(path) as f:
+                maptext = f.read()
+            changed = incremental.update(maptext)
+            lines = _lines(func(maptext, incremental, **options))
+        except Exception as e:
+            # A map being written can be incomplete, the next change will
+            # give the complete one
+            yield '{}: {}: {}'.format(path, e.__class__.__name__, e)
+            continue
+        runs += 1
+
+        if previous_lines is None:
+            for line in lines:
+                yield line
+        else:
+            yield '{} changed, changed sections: {}'.format(
+                path, ', '.join(changed) if changed else 'none')
+            for line in difflib.unified_diff(previous_lines, lines,
+                                             lineterm='', n=0):
+                if not line.startswith(('---', '+++')):
+                    yield line
+        previous_lines = lines
+
+
+def run(args, parser, func, options):
+    """ Watch mode of the command line, until interrupted """
+    o = sys.stdout if args.o is None else open(args.o, 'w')
+    try:
+        for line in watch(args.i, parser, func, options, args.watch):
+            o.write(line + '\n')
+            o.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if o is not sys.stdout:
+            o.close()
@@ -17,15 +17,14 @@ setup(
         'Topic :: Software Development :: Embedded Systems',
         'Topic :: Software Development :: Debuggers',
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        # 'Programming Language :: Python :: 3.2',
-        # 'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        # 'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6'
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12'
     ],
     keywords='map memory compiler debugger development embedded',
-    packages=['mapography'],
-    python_requires='>=2.7')
+    packages=['mapography', 'mapography.parser', 'mapography.commands'],
+    python_requires='>=3.9',
+    extras_require={'zstd': ['zstandard']})
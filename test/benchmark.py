@@ -0,0 +1,212 @@
+# coding: utf-8
+
+"""
+Benchmarks of the parser and of the model: wall time and peak memory of each
+stage, on a synthetic map (see synthetic.py) or on a given map file.
+
+Usage examples:
+python benchmark.py --modules 2000 --functions 20000
+python benchmark.py --map big.map --json results.json
+python benchmark.py --compare results.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mapography import reader  # noqa: E402
+from mapography.parser import cosmic  # noqa: E402
+from mapography.commands import modules as modules_command  # noqa: E402
+
+import synthetic  # noqa: E402
+
+
+def measure(func, memory=True):
+    """
+    Call func and measure it. The memory tracing slows down the call, the
+    times measured with and without it are not comparable.
+    :return: (result, wall time in seconds, peak of the memory allocated
+    during the call in bytes, None if memory is False)
+    """
+    if not memory:
+        start = time.perf_counter()
+        result = func()
+        return result, time.perf_counter() - start, None
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def stages(path, input_mode=reader.MMAP, max_depth=8, top=10):
+    """
+    Generator of the benchmark stages, in order. The later stages use the
+    results of the earlier ones.
+    :return: iterator of (stage name, function, number of bytes processed or
+    None, function to keep the result)
+    """
+    results = {}
+    size = os.path.getsize(path)
+
+    def keep(name):
+        return lambda result: results.__setitem__(name, result)
+
+    with reader.open_map(path, input_mode) as maptext:
+        # A stream is parsed in one pass, without index
+        results['index'] = None
+        if input_mode != reader.STREAM:
+            yield ('index', lambda: cosmic.index_sections(maptext), size,
+                   keep('index'))
+        for name, title, getter in [
+                ('segments', cosmic.SEGMENTS, cosmic.get_segments),
+                ('modules', cosmic.MODULES, cosmic.get_modules),
+                ('call tree', cosmic.CALL_TREE, cosmic.get_call_tree),
+                ('symbols', cosmic.SYMBOLS, cosmic.get_symbols)]:
+            section_size = None
+            if results['index'] is not None:
+                start, end = results['index'].get(title, (0, 0))
+                section_size = end - start
+            yield ('parse ' + name,
+                   lambda getter=getter: getter(maptext, results['index']),
+                   section_size, keep(name))
+
+    call_tree = results['call tree']
+    yield 'longest path', call_tree.longest_path, None, keep('longest')
+    yield ('call paths',
+           lambda: call_tree.call_paths(max_depth=max_depth, top=top), None,
+           keep('paths'))
+    yield ('draw call tree',
+           lambda: sum(1 for _ in call_tree.draw_lines(max_depth)), None,
+           keep('lines'))
+    yield ('module sizes',
+           lambda: modules_command.aggregate_sizes(results['modules']), None,
+           keep('sizes'))
+
+
+def run(path, input_mode=reader.MMAP, max_depth=8, top=10, memory=True):
+    """
+    Run the benchmark stages on a map file
+    :return: list of dicts with the keys stage, seconds, peak_bytes and
+    mb_per_s (None for the analysis stages and the parsing of a stream)
+    """
+    measures = []
+    for stage, func, size, keep in stages(path, input_mode, max_depth, top):
+        result, elapsed, peak = measure(func, memory)
+        keep(result)
+        throughput = None
+        if size is not None and elapsed > 0:
+            throughput = size / elapsed / 1e6
+        measures.append(dict(stage=stage, seconds=elapsed, peak_bytes=peak,
+                             mb_per_s=throughput))
+    return measures
+
+
+def compare(measures, baseline, tolerance):
+    """
+    Compare measures with the ones of a previous run
+    :param tolerance: relative increase of the time or of the peak memory
+    of a stage above which it is a regression, 0.2 for 20%
+    :return: list of the regression descriptions
+    """
+    previous = {measure['stage']: measure for measure in baseline}
+    regressions = []
+    for measure in measures:
+        before = previous.get(measure['stage'])
+        if before is None:
+            continue
+        for key in ('seconds', 'peak_bytes'):
+            if before[key] and measure[key] is not None and \
+                    measure[key] > before[key] * (1 + tolerance):
+                regressions.append('{}: {} {:.6g} -> {:.6g} (+{:.0%})'.format(
+                    measure['stage'], key, before[key], measure[key],
+                    measure[key] / before[key] - 1))
+    return regressions
+
+
+def format_measures(measures):
+    lines = ['{:<16} {:>10} {:>12} {:>8}'.format('stage', 'time (ms)',
+                                                 'peak (KiB)', 'MB/s')]
+    for measure in measures:
+        throughput = measure['mb_per_s']
+        peak = measure['peak_bytes']
+        lines.append('{:<16} {:>10.1f} {:>12} {:>8}'.format(
+            measure['stage'], measure['seconds'] * 1000,
+            '' if peak is None else '{:.0f}'.format(peak / 1024),
+            '' if throughput is None else '{:.1f}'.format(throughput)))
+    return '\n'.join(lines)
+
+
+def main(argv):
+    argparser = argparse.ArgumentParser(prog='benchmark')
+    argparser.add_argument('--map', help='Map file to benchmark, a synthetic '
+                                         'map is generated if not given')
+    argparser.add_argument('--modules', type=int, default=1000)
+    argparser.add_argument('--functions', type=int, default=10000)
+    argparser.add_argument('--symbols', type=int, default=10)
+    argparser.add_argument('--depth', type=int, default=8)
+    argparser.add_argument('--fanout', type=int, default=3)
+    argparser.add_argument('--seed', type=int, default=0)
+    argparser.add_argument('--input-mode', choices=reader.INPUT_MODES,
+                           default=reader.MMAP)
+    argparser.add_argument('--max-depth', type=int, default=8,
+                           help='Maximum depth of the call paths and tree')
+    argparser.add_argument('--no-memory', dest='memory',
+                           action='store_false',
+                           help='Measure the times only, without the '
+                                'overhead of the memory tracing')
+    argparser.add_argument('--json', metavar='FILE',
+                           help='Write the measures to FILE')
+    argparser.add_argument('--compare', metavar='FILE',
+                           help='Measures of a previous run, written with '
+                                '--json, to detect the regressions')
+    argparser.add_argument('--tolerance', type=float, default=0.2,
+                           help='Relative increase considered as a '
+                                'regression (default 0.2)')
+    args = argparser.parse_args(argv)
+
+    path = args.map
+    if path is None:
+        path = 'synthetic_{}_{}.map'.format(args.modules, args.functions)
+        with open(path, 'w') as out:
+            synthetic.generate(out, modules=args.modules,
+                               functions=args.functions, symbols=args.symbols,
+                               depth=args.depth, fanout=args.fanout,
+                               seed=args.seed)
+
+    try:
+        measures = run(path, args.input_mode, args.max_depth,
+                       memory=args.memory)
+    finally:
+        if args.map is None:
+            os.remove(path)
+
+    print(format_measures(measures))
+
+    if args.json is not None:
+        with open(args.json, 'w') as out:
+            json.dump(measures, out, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as baseline:
+            regressions = compare(measures, json.load(baseline),
+                                  args.tolerance)
+        for regression in regressions:
+            print('Regression ' + regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,225 @@
+# coding: utf-8
+
+"""
+Generator of synthetic Cosmic map files of configurable size, for the
+benchmarks.
+
+Usage example:
+python synthetic.py -o big.map --modules 2000 --functions 20000
+"""
+
+import sys
+import random
+import argparse
+
+SECTIONS = ['const', 'vtext', 'sdata', 'sbss', '.debug', '.info.']
+
+# Base address of each section
+SECTION_BASES = {
+    'const': 0x00000000,
+    'vtext': 0x00100000,
+    'sdata': 0x40000000,
+    'sbss': 0x40800000,
+    '.debug': 0x00000000,
+    '.info.': 0x00000000
+}
+
+
+def _header(title, indent):
+    dashes = ' ' * indent + '-' * len(title)
+    return '{}\n{}{}\n{}\n'.format(dashes, ' ' * indent, title, dashes)
+
+
+def make_call_graph(functions, depth, fanout, recursion, rand):
+    """
+    Random layered call graph: the functions of a layer call functions of the
+    next layers, and with probability recursion one of the previous layers.
+    :return: (list of (name, stack size), dict name -> list of called names,
+    list of the root names)
+    """
+    names = ['_Function_{}'.format(n) for n in range(functions)]
+    layers = [names[n::depth] for n in range(depth)]
+    sizes = [(name, rand.randrange(0, 64, 4)) for name in names]
+
+    calls = {}
+    for layer_index, layer in enumerate(layers):
+        below = [name for lower_layer in layers[layer_index + 1:]
+                 [:2] for name in lower_layer]
+        above = [name for upper_layer in layers[:layer_index]
+                 for name in upper_layer[:50]]
+        for name in layer:
+            callees = rand.sample(below, min(len(below),
+                                             rand.randint(0, fanout)))
+            if above and rand.random() < recursion:
+                callees.append(rand.choice(above))
+            calls[name] = sorted(set(callees))
+
+    return sizes, calls, layers[0]
+
+
+def _call_tree_lines(sizes, calls, roots):
+    """
+    Lines of the call tree section. Like Cosmic, a function is expanded the
+    first time it is printed, later on it is a reference to the index of its
+    first print. The functions not reached from the roots are expanded as
+    roots too, and every function is listed at the root level.
+    """
+    size_of = dict(sizes)
+    first_index = {}
+    index = 0
+
+    for root in roots + [name for name, _ in sizes]:
+        if root in first_index:
+            continue
+        stack = [(root, 0)]
+        while stack:
+            name, level = stack.pop()
+            index += 1
+            if level == 0:
+                prefix = '{:4d} > '.format(index)
+            else:
+                prefix = '{:4d}      {}+ '.format(index, '|    ' * (level - 1))
+
+            if name in first_index:
+                yield '{}{} --> {}'.format(prefix, name, first_index[name])
+            else:
+                first_index[name] = index
+                yield '{}{}: ({})'.format(prefix, name, size_of[name])
+                for callee in reversed(calls[name]):
+                    stack.append((callee, level + 1))
+        yield ''
+
+    expanded_roots = set(roots)
+    for name, _ in sizes:
+        if name not in expanded_roots:
+            index += 1
+            yield '{:4d}   {} --> {}'.format(index, name, first_index[name])
+            yield ''
+
+
+def generate(out, modules=100, functions=1000, symbols=10, depth=8,
+             fanout=3, recursion=0.01, seed=0):
+    """
+    Write a synthetic Cosmic map file
+    :param out: file object to write to
+    :param modules: number of modules, each with one segment per section
+    :param functions: number of functions in the call tree
+    :param symbols: number of data symbols per module, in addition to the
+    functions
+    :param depth: number of layers of the call graph
+    :param fanout: maximum number of calls of a function
+    :param recursion: probability for a function to call a function of a
+    previous layer, making a recursive cycle
+    :param seed: random seed, the same parameters give the same file
+    """
+    rand = random.Random(seed)
+
+    module_names = ['src\\dir{}\\module{}.o'.format(n % 20, n)
+                    for n in range(modules)]
+    lengths = {(module, section): rand.randrange(0, 4096)
+               for module in module_names for section in SECTIONS}
+
+    # Contiguous layout of the module segments of each section
+    starts = {}
+    totals = {}
+    for section in SECTIONS:
+        address = SECTION_BASES[section]
+        for module in module_names:
+            starts[module, section] = address
+            address += lengths[module, section]
+        totals[section] = address - SECTION_BASES[section]
+
+    out.write('\nMap of Synthetic.ppc from link file Synthetic.lkf - '
+              'Mon Jan  1 00:00:00 2018\n\n\n')
+
+    out.write(_header('Segments', 31) + '\n')
+    for section in SECTIONS:
+        start = SECTION_BASES[section]
+        out.write('start {:08x} end {:08x} length {:5d} segment {}\n'.format(
+            start, start + totals[section], totals[section], section))
+    out.write('\n\n')
+
+    out.write(_header('Modules', 31) + '\n')
+    for module in module_names:
+        out.write('{}:\n'.format(module))
+        for section in SECTIONS:
+            start = starts[module, section]
+            length = lengths[module, section]
+            out.write('start {:08x} end {:08x} length {:5d} section {}'
+                      '\n'.format(start, start + length, length, section))
+        out.write('\n')
+    out.write('\n')
+
+    sizes, calls, roots = make_call_graph(functions, depth, fanout, recursion,
+                                          rand)
+    function_modules = {name: module_names[n % modules]
+                        for n, (name, _) in enumerate(sizes)}
+
+    out.write(_header('Stack usage', 29) + '\n')
+    for name, size in sizes:
+        out.write('{:<26} {:4d}   ({})\n'.format(name, size, size))
+    out.write('\nStack size: 0\n\n\n')
+
+    out.write(_header('Call tree', 30))
+    for line in _call_tree_lines(sizes, calls, roots):
+        out.write(line + '\n')
+    out.write('\n\n\n')
+
+    out.write(_header('Symbols', 31) + '\n')
+    users = {}
+    for caller, callees in calls.items():
+        for callee in callees:
+            users.setdefault(callee, set()).add(function_modules[caller])
+    symbol_lines = []
+    for n, (name, _) in enumerate(sizes):
+        module = function_modules[name]
+        address = starts[module, 'vtext'] + n // modules * 4
+        symbol_lines.append((name, address, module, 'vtext',
+                             sorted(users.get(name, []))))
+    for module in module_names:
+        for n in range(symbols):
+            symbol_lines.append((
+                '_{}_data{}'.format(module.split('\\')[-1][:-2], n),
+                starts[module, 'sdata'] + n * 4, module, 'sdata',
+                [module_names[rand.randrange(modules)]]))
+
+    for name, address, module, section, used_in in sorted(symbol_lines):
+        out.write('{:<23} {:08x}   defined in {} section {} (.{})\n'.format(
+            name, address, module, section, section))
+        if used_in:
+            for user in used_in:
+                out.write('{}used in {}\n'.format(' ' * 35, user))
+        else:
+            out.write('{}*** not used ***\n'.format(' ' * 35))
+
+
+def main(argv):
+    argparser = argparse.ArgumentParser(prog='synthetic')
+    argparser.add_argument('-o', help='Output file, standard output if not '
+                                      'given', metavar='output_file')
+    argparser.add_argument('--modules', type=int, default=100)
+    argparser.add_argument('--functions', type=int, default=1000)
+    argparser.add_argument('--symbols', type=int, default=10,
+                           help='Data symbols per module')
+    argparser.add_argument('--depth', type=int, default=8,
+                           help='Layers of the call graph')
+    argparser.add_argument('--fanout', type=int, default=3,
+                           help='Maximum calls per function')
+    argparser.add_argument('--recursion', type=float, default=0.01,
+                           help='Probability of a recursive call')
+    argparser.add_argument('--seed', type=int, default=0)
+    args = argparser.parse_args(argv)
+
+    parameters = dict(modules=args.modules, functions=args.functions,
+                      symbols=args.symbols, depth=args.depth,
+                      fanout=args.fanout, recursion=args.recursion,
+                      seed=args.seed)
+    if args.o is None:
+        generate(sys.stdout, **parameters)
+    else:
+        with open(args.o, 'w') as out:
+            generate(out, **parameters)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
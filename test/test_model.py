@@ -1,8 +1,10 @@
 # coding: utf-8
 
+import io
+import os
 import re
 
-from mapography import model, parser
+from mapography import model, parser, reader, cache
 import mapography.parser.cosmic
 
 
@@ -15,6 +17,9 @@ with open("samples/cosmic/modules.txt") as sf:
 with open("samples/cosmic/call_tree.txt") as sf:
     _MAP_CALL_TREE = sf.read()
 
+with open("samples/cosmic/cosmic.map") as sf:
+    _MAP = sf.read()
+
 
 def test_segment():
     regex = r"start\s+(?P<start>[0-9a-fA-F]+)\s+end\s+(?P<end>[0-9a-fA-F]+)\s+"\
@@ -119,11 +124,946 @@ def test_cosmic_parser():
     print()
 
 
+def _make_layered_call_tree(layers, width):
+    # Every function of a layer calls every function of the next layer, which
+    # gives width ** layers call paths
+    call_tree = model.CallTree()
+    for layer in range(layers):
+        for n in range(width):
+            call_tree.add_function("f_{}_{}".format(layer, n), n + 1)
+    for n in range(width):
+        call_tree.connect("f_0_{}".format(n), None)
+    for layer in range(1, layers):
+        for n in range(width):
+            for caller in range(width):
+                call_tree.connect("f_{}_{}".format(layer, n),
+                                  "f_{}_{}".format(layer - 1, caller))
+    return call_tree
+
+
+def test_longest_path():
+    call_tree = parser.cosmic.get_call_tree(_MAP)
+    longest = call_tree.longest_path()
+    assert longest == max(call_tree.call_paths(), key=lambda p: p[0])
+    assert longest == (172, [('_main', 132), ('_Module2_SendInfo', 12),
+                             ('_Device_Write', 28)])
+
+    assert model.CallTree().longest_path() == (0, [])
+
+    # 4 ** 40 paths, not enumerable
+    call_tree = _make_layered_call_tree(40, 4)
+    size, path = call_tree.longest_path()
+    assert size == 40 * 4
+    assert [name for name, _ in path] == ["f_{}_3".format(layer)
+                                          for layer in range(40)]
+
+
+def test_recursive_call_tree():
+    call_tree = parser.cosmic.get_call_tree(_MAP_CALL_TREE)
+    assert call_tree.recursive_cycles() == [
+        ['Function_D2', 'Function_E0', '_Function_B1', '_Function_C5',
+         '_Function_F1']]
+    # A cycle counts all its functions, which bounds every call path
+    assert call_tree.longest_path()[0] >= max(call_tree.call_paths())[0]
+    assert all(len(p[1]) <= 3 for p in call_tree.call_paths(max_depth=3))
+    assert "_Function_F1 (132) (recursive)" in call_tree.draw_call_tree()
+
+    # Deeper than the Python recursion limit
+    call_tree = model.CallTree()
+    for n in range(5000):
+        call_tree.add_function("f_{}".format(n), 1)
+    call_tree.connect("f_0", None)
+    for n in range(1, 5000):
+        call_tree.connect("f_{}".format(n), "f_{}".format(n - 1))
+    call_tree.add_function("f_self", 1, recursive=True)
+    call_tree.connect("f_self", "f_4999")
+
+    assert call_tree.call_paths()[0][0] == 5001
+    assert call_tree.longest_path()[0] == 5001
+    assert call_tree.recursive_cycles() == [['f_self']]
+    assert len(call_tree.draw_call_tree(max_depth=10).splitlines()) == 1
+
+    # The usage of a cycle doesn't depend on where the walk enters it
+    call_tree = model.CallTree()
+    for name, size in [('R1', 0), ('R2', 1), ('X', 1), ('Y', 100)]:
+        call_tree.add_function(name, size)
+    call_tree.connect('R1', None)
+    call_tree.connect('R2', None)
+    call_tree.connect('Y', 'R1')
+    call_tree.connect('X', 'Y')
+    call_tree.connect('Y', 'X')
+    call_tree.connect('X', 'R2')
+    assert call_tree.recursive_cycles() == [['X', 'Y']]
+    assert max(call_tree.call_paths()) == \
+        (102, [('R2', 1), ('X', 1), ('Y', 100)])
+    assert call_tree.longest_path() == max(call_tree.call_paths())
+    assert call_tree.stack_usage()['X'] == call_tree.stack_usage()['Y'] == \
+        (101, None)
+    assert call_tree.heaviest_path('R1') == [('R1', 0), ('Y', 100), ('X', 1)]
+    assert call_tree.reaching_roots('X') == ['R1', 'R2']
+    assert call_tree.reaching_roots('R2') == ['R2']
+
+
+def test_call_paths_selection():
+    call_tree = _make_layered_call_tree(6, 4)
+    all_paths = call_tree.call_paths()
+    assert len(all_paths) == 4 ** 6
+    assert call_tree.call_paths(top=10) == all_paths[:10]
+    assert call_tree.call_paths(min_stack=20) == \
+        [p for p in all_paths if p[0] >= 20]
+    assert call_tree.call_paths(min_stack=24, top=3) == all_paths[:1]
+
+    paths = call_tree.iter_call_paths()
+    assert next(paths) == (6, [("f_{}_0".format(n), 1) for n in range(6)])
+
+
+def test_index_sections():
+    cosmic = parser.cosmic
+    index = cosmic.index_sections(_MAP)
+    assert sorted(index) == sorted([cosmic.SEGMENTS, cosmic.MODULES,
+                                    cosmic.STACK_USAGE, cosmic.CALL_TREE,
+                                    cosmic.SYMBOLS])
+    assert cosmic.index_sections(_MAP.encode()) == index
+
+    start, end = index[cosmic.SEGMENTS]
+    lines = list(cosmic.iter_lines(_MAP, start, end))
+    assert lines == _MAP[start:end].split('\n')[:-1]
+    assert lines[1].endswith('segment rchw')
+
+    assert [repr(s) for s in cosmic.get_segments(_MAP, index)] == \
+        [repr(s) for s in cosmic.get_segments(_MAP.encode())]
+    assert len(cosmic.get_modules(_MAP, index)) == 5
+    assert cosmic.get_call_tree(_MAP, index).longest_path()[0] == 172
+
+
+def test_input_modes():
+    cosmic = parser.cosmic
+    titles = cosmic.index_sections(_MAP).keys()
+    for mode in reader.INPUT_MODES:
+        for title in titles:
+            with reader.open_map("samples/cosmic/cosmic.map", mode) as maptext:
+                assert list(cosmic.section_lines(maptext, title)) == \
+                    list(cosmic.section_lines(_MAP, title))
+
+    with reader.open_map("samples/cosmic/call_tree.txt",
+                         reader.STREAM) as maptext:
+        call_tree = cosmic.get_call_tree(maptext)
+    assert call_tree.longest_path()[0] == 936
+
+
+def test_cache():
+    import shutil
+    import tempfile
+
+    directory = tempfile.mkdtemp()
+    try:
+        map_cache = cache.MapCache(directory)
+        cached_parser = cache.CachedParser(
+            parser.cosmic, "samples/cosmic/cosmic.map", map_cache)
+        modules = cached_parser.get_modules(_MAP)
+        # Not parsed again, the map content is not used
+        assert [repr(m) for m in cached_parser.get_modules(None)] == \
+            [repr(m) for m in modules]
+        cached_parser.get_call_tree(_MAP)
+        assert cached_parser.get_call_tree(None).longest_path()[0] == 172
+        assert len(os.listdir(directory)) == 2
+
+        map_cache.max_size = 1
+        map_cache.evict()
+        assert not os.listdir(directory)
+
+        # Entries evicted meanwhile by another process sharing the directory
+        map_cache.put('a', 1)
+        remove = os.remove
+
+        def racing_remove(path):
+            remove(path)
+            remove(path)
+        os.remove = racing_remove
+        try:
+            map_cache.put('b', 2)
+        finally:
+            os.remove = remove
+        assert not os.listdir(directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_batch():
+    import argparse
+    from mapography import batch
+
+    paths = batch.expand_paths(["samples/cosmic/*.map",
+                                "samples/cosmic/call_tree.txt"])
+    command_list = [batch.parse_command(text) for text in
+                    ["calls longest", "modules list",
+                     "calls callers _Device_Write", "calls function _nope"]]
+    reports = list(batch.run_batch(paths, 'cosmic', command_list, jobs=2))
+
+    assert [r['path'] for r in reports] == paths
+    # call_tree.txt has no modules, the other commands still run
+    assert reports[0]['error'] is None
+    assert list(reports[0]['errors']) == ['modules list']
+    assert reports[0]['results']['calls longest'].startswith('(936, ')
+    assert reports[1]['error'] is None and not reports[1]['errors']
+    assert reports[1]['results']['calls longest'].startswith('(172, ')
+    assert reports[1]['results']['calls callers _Device_Write'] == \
+        '_Module2_SendInfo'
+    assert reports[1]['results']['calls function _nope'] == \
+        '_nope: unknown function'
+
+    for text in ["calls", "calls nothing", "calls callers",
+                 "calls tree --depth 2", "export columnar --file out.bin",
+                 "lookup addresses"]:
+        try:
+            batch.parse_command(text)
+        except argparse.ArgumentTypeError:
+            pass
+        else:
+            assert False, "'{}' accepted".format(text)
+    assert batch.parse_command("lookup addresses -f a.txt") == \
+        ('lookup', 'addresses', '-f', 'a.txt')
+
+
+def test_compact_model():
+    segment = model.Segment.from_parsed('vtext', 0x80, 0xc2)
+    assert repr(segment) == repr(model.Segment('vtext', '80', 'c2'))
+    assert len(segment) == 66
+    assert not hasattr(segment, '__dict__')
+
+    module = model.Module.from_parsed('main.o', [segment])
+    assert repr(module) == repr(model.Module('main.o', [segment]))
+    assert len(module) == 66
+
+    symbol = model.Symbol.from_parsed('_main', 0x80)
+    assert symbol.address == model.Symbol('_main', '80').address
+
+
+def test_address_index():
+    segments = parser.cosmic.get_segments(_MAP)
+    modules = parser.cosmic.get_modules(_MAP)
+    symbols = [model.Symbol('_Device_Read', '182'),
+               model.Symbol('_Device_Write', '1c4'),
+               model.Symbol('__sdata', '40000000')]
+    index = model.AddressIndex(segments, modules, symbols)
+
+    result = index.lookup(0x1c8)
+    assert [s.name for s in result['segments']] == ['.debug', '.info.',
+                                                    'vtext']
+    assert ('vtext', modules[3]) in result['modules']
+    assert result['symbol'][0].name == '_Device_Write'
+    assert result['symbol'][1] == 4
+
+    results = index.lookup_many(['40000010', 0x90000000])
+    assert results[0]['modules'] == [('sdata', modules[3])]
+    assert results[1]['segments'] == results[1]['modules'] == []
+    assert results[1]['symbol'] is None  # not in the segment of __sdata
+
+    # A symbol must be in a containing segment of its section
+    index = model.AddressIndex(segments, modules,
+                               parser.cosmic.get_symbols(_MAP).symbols)
+    result = index.lookup(0x500)
+    assert [s.name for s in result['segments']] == ['.debug']
+    assert result['symbol'] is None
+    assert index.lookup(0x278)['symbol'][0].name == '__idesc__'
+    assert index.lookup(0x1c8)['symbol'][0].name == '_Device_Write'
+
+    from mapography.commands import lookup
+    with open('out.txt', 'w') as f:
+        f.write('500 0x1c8\nzz\n')
+    assert list(lookup.addresses(_MAP, parser.cosmic, 'out.txt')) == [
+        '0x500: segment .debug, module src\\drv\\driver.o (.debug)',
+        lookup._format(index.lookup(0x1c8)), 'zz: invalid address']
+
+    # Sections read from a stream in the order of the file
+    with reader.open_map("samples/cosmic/cosmic.map",
+                         reader.STREAM) as maptext:
+        assert len(parser.cosmic.get_segments(maptext)) == len(segments)
+        assert len(parser.cosmic.get_modules(maptext)) == len(modules)
+
+
+def test_modules_sizes():
+    from mapography.commands import modules as modules_command
+
+    modules = parser.cosmic.get_modules(_MAP)
+    sizes = modules_command.aggregate_sizes(modules)
+    assert sizes['vtext']['src\\drv\\driver.o'] == 148
+    assert sum(sizes['vtext'].values()) == 500
+
+    sizes = modules_command.aggregate_sizes(modules, rollup=1)
+    assert sizes['vtext'] == {'src': 378, 'C:': 122}
+
+    text = modules_command.sizes(_MAP, parser.cosmic, totals=True,
+                                 percent=True)
+    assert 'src\\drv\\driver.o (148, 29.6%)\n' in text
+    assert 'total (500)' in text
+
+
+def test_symbols():
+    symbols = parser.cosmic.get_symbols(_MAP)
+    assert len(symbols) == 17
+
+    device_read = symbols['_Device_Read']
+    assert device_read.address == 0x182
+    assert device_read.module == 'src\\drv\\driver.o'
+    assert device_read.section == 'vtext'
+    assert device_read.used_in == ['src\\app\\module2.o']
+
+    assert symbols['__idesc__'].section == '.init'
+    assert symbols['__eram'].module == 'command file'
+    assert symbols['__eram'].section is None
+    assert [s.name for s in symbols.unused()] == ['__memory', '__sbss',
+                                                  '__stext', '_exit']
+    assert len(symbols.symbols_used_by('src\\main.o')) == 5
+    assert len(symbols.symbols_defined_by('src\\app\\module2.o')) == 3
+
+    # Several users, on continuation lines
+    symbols_dicts = parser.cosmic.parse_symbols(
+        "_f    00000010   defined in a.o section .text\n"
+        "                 used in b.o\n"
+        "                         c d.o\n")
+    assert symbols_dicts[0]['used_in'] == ['b.o', 'c d.o']
+
+
+def test_diff():
+    from mapography import diff
+    from mapography.commands import diff as diff_command
+
+    deltas = diff.diff_values({'a': 1, 'b': 5, 'c': 2},
+                              {'a': 1, 'b': 2, 'd': 9})
+    assert deltas == [('d', None, 9, 9), ('b', 5, 2, -3), ('c', 2, None, -2)]
+
+    new_map = _MAP.replace("end 000001fc length   148",
+                           "end 00000208 length   160")
+    for parallel in (False, True):
+        assert diff_command.modules(new_map, parser.cosmic,
+                                    "samples/cosmic/cosmic.map", parallel) \
+            == "src\\drv\\driver.o (vtext): 148 -> 160 (+12)"
+    assert diff_command.functions(_MAP, parser.cosmic,
+                                  "samples/cosmic/cosmic.map") \
+        == "worst case stack: 172 -> 172 (+0)"
+
+
+def test_history():
+    from mapography import history
+
+    database = history.History(':memory:')
+    cosmic = parser.cosmic
+    database.ingest('1', cosmic.get_segments(_MAP), cosmic.get_modules(_MAP),
+                    cosmic.get_call_tree(_MAP))
+    new_map = _MAP.replace("end 000001fc length   148",
+                           "end 00000208 length   160")
+    database.ingest('2', cosmic.get_segments(new_map),
+                    cosmic.get_modules(new_map))
+    history.ingest_map(database, '3', "samples/cosmic/call_tree.txt", cosmic)
+
+    assert database.trend() == [('1', 172), ('3', 936)]
+    assert database.trend(section='vtext') == [('1', 500), ('2', 512)]
+    assert database.trend(function='_Device_Write') == [('1', 28)]
+    assert database.first_exceeding(150, module='src\\drv\\driver.o',
+                                    section='vtext') == ('2', 160)
+    assert database.first_exceeding(1000) is None
+
+    # Ingesting an old build again keeps its place in the history
+    database.ingest('1', cosmic.get_segments(new_map),
+                    cosmic.get_modules(new_map), cosmic.get_call_tree(_MAP))
+    assert database.trend() == [('1', 172), ('3', 936)]
+    assert database.trend(section='vtext') == [('1', 512), ('2', 512)]
+    assert database.first_exceeding(150, module='src\\drv\\driver.o',
+                                    section='vtext') == ('1', 160)
+    database.close()
+
+
+def test_synthetic_map():
+    import synthetic
+    import benchmark
+
+    out = io.StringIO()
+    synthetic.generate(out, modules=20, functions=200, symbols=2, depth=4,
+                       recursion=0.05, seed=1)
+    maptext = out.getvalue()
+
+    cosmic = parser.cosmic
+    assert len(cosmic.get_segments(maptext)) == len(synthetic.SECTIONS)
+    assert len(cosmic.get_modules(maptext)) == 20
+    call_tree = cosmic.get_call_tree(maptext)
+    assert len(call_tree.functions) == 200
+    assert call_tree.longest_path()[0] > 0
+    assert len(cosmic.get_symbols(maptext)) == 200 + 20 * 2
+
+    with open('out.txt', 'w') as map_file:
+        map_file.write(maptext)
+    stages = [measure['stage'] for measure in benchmark.run('out.txt')]
+    assert stages[:2] == ['index', 'parse segments']
+    assert len(stages) == 9
+
+
+def test_profiling():
+    from mapography import profiling
+
+    with profiling.Profiler(memory=True) as profiler:
+        with profiling.stage('command'):
+            parser.cosmic.get_call_tree(_MAP)
+            parser.cosmic.get_call_tree(_MAP)
+    assert profiling.stage('command') is not None
+
+    stats = {result['stage']: result for result in profiler.results()}
+    assert list(stats)[:2] == ['command', 'command/get_call_tree']
+    assert stats['command/get_call_tree']['calls'] == 2
+    assert stats['command/get_call_tree/tokenize_call_tree']['calls'] == 2
+    assert stats['command']['seconds'] >= \
+        stats['command/get_call_tree']['seconds']
+    assert stats['command']['peak_bytes'] >= \
+        stats['command/get_call_tree/make_call_tree']['peak_bytes'] > 0
+    assert 'command/get_call_tree/index_sections' in profiler.report()
+
+
+def test_draw_call_tree():
+    call_tree = model.CallTree()
+    for n in range(3000):
+        call_tree.add_function('f{}'.format(n), 4)
+    call_tree.connect('f0', None)
+    for n in range(1, 3000):
+        call_tree.connect('f{}'.format(n), 'f{}'.format(n - 1))
+    call_tree.connect('f0', 'f2999')
+    lines = list(call_tree.draw_lines())
+    assert len(lines) == 1
+    assert lines[0].endswith(' - f2999 (4) - f0 (4) (recursive)')
+
+    call_tree = parser.cosmic.get_call_tree(_MAP_CALL_TREE)
+    drawing = call_tree.draw_call_tree()
+    collapsed = call_tree.draw_call_tree(collapse=True)
+    assert len(collapsed) < len(drawing)
+    assert collapsed.splitlines()[-1] == " - _Function_F1 (132) (above)"
+    assert "Function_F0 (20) (above)" in collapsed
+
+
+def test_compact_call_graph():
+    call_tree = parser.cosmic.get_call_tree(_MAP_CALL_TREE)
+    graph = call_tree.compact()
+    assert graph is call_tree.compact()
+    assert graph.names == sorted(call_tree.functions)
+    assert len(graph) == len(call_tree.functions)
+    for name, function in call_tree.functions.items():
+        n = graph.ids[name]
+        assert graph.sizes[n] == function['size']
+        assert [graph.names[c] for c in graph.calls(n)] == \
+            sorted(function['calls'])
+    assert [graph.names[root] for root in graph.roots] == \
+        sorted(call_tree.roots)
+
+    stack_size, path = graph.longest_path()
+    assert (stack_size, [graph.names[n] for n in path]) == \
+        (call_tree.longest_path()[0],
+         [name for name, _ in call_tree.longest_path()[1]])
+
+    call_tree.add_function('_Function_Z', 1000)
+    call_tree.connect('_Function_Z', '_Function_C6')
+    assert call_tree.compact() is not graph
+    assert call_tree.longest_path()[1][-1] == ('_Function_Z', 1000)
+
+
+def test_callers_and_entry_depth():
+    call_tree = parser.cosmic.get_call_tree(_MAP)
+    assert call_tree.callers('_Device_Write') == ['_Module2_SendInfo']
+    assert call_tree.callers('_main') == []
+    assert call_tree.entry_depth('_Device_Write') == (
+        144, [('_main', 132), ('_Module2_SendInfo', 12),
+              ('_Device_Write', 28)])
+    assert call_tree.entry_depth('_main') == (0, [('_main', 132)])
+    assert call_tree.reaching_roots('_Device_Write') == [
+        '_Device_Write', '_Module2_SendInfo', '_main']
+
+    call_tree = parser.cosmic.get_call_tree(_MAP_CALL_TREE)
+    assert call_tree.callers('Function_F0') == [
+        'Function_D2', 'Function_E0', '_Function_A2']
+    assert call_tree.entry_depth('Function_F0')[0] == 740
+    assert call_tree.reaching_roots('_Function_C6') == [
+        '_Function_A2', '_Function_F1']
+    # Same roots as a walk of the callers of each function
+    for name in call_tree.functions:
+        found = {name}
+        stack = [name]
+        while stack:
+            for caller in call_tree.callers(stack.pop()):
+                if caller not in found:
+                    found.add(caller)
+                    stack.append(caller)
+        assert call_tree.reaching_roots(name) == \
+            sorted(found & set(call_tree.roots))
+
+    from mapography.commands import calls
+    assert calls.callers(_MAP, parser.cosmic, '_Device_Write',
+                         transitive=True) == '_Module2_SendInfo\n_main'
+    assert calls.callers(_MAP, parser.cosmic, '_main') == '-'
+    lines = calls.function(_MAP, parser.cosmic, '_Module2_SendInfo')
+    assert 'worst stack through: 172' in lines.splitlines()
+
+
+def test_export():
+    import json
+    from mapography import export
+
+    cosmic = parser.cosmic
+    records = [json.loads(line) for line in export.iter_jsonl(_MAP, cosmic)]
+    assert records[0]['type'] == 'header'
+    functions = {record['name']: record for record in records
+                 if record['type'] == 'function'}
+    assert functions['_main']['root'] and functions['_main']['size'] == 132
+    assert '_Module2_SendInfo' in functions['_main']['calls']
+    assert len([record for record in records
+                if record['type'] == 'symbol']) == \
+        len(cosmic.get_symbols(_MAP))
+
+    with open('out.txt', 'wb') as f:
+        rows = export.write_columnar(_MAP, cosmic, f)
+    tables = export.load_columnar('out.txt')
+    assert {name: len(table['name']) for name, table in tables.items()} == rows
+
+    segments = cosmic.get_segments(_MAP)
+    assert tables['segments']['name'] == [s.name for s in segments]
+    assert list(tables['segments']['end']) == [s.end for s in segments]
+
+    modules = tables['modules']
+    n = modules['name'].index('src\\drv\\driver.o')
+    start, end = modules['segment_offsets'][n:n + 2]
+    driver = [module for module in cosmic.get_modules(_MAP)
+              if module.name == 'src\\drv\\driver.o'][0]
+    assert modules['segment_name'][start:end] == \
+        [segment.name for segment in driver.segments]
+
+    symbols = tables['symbols']
+    n = symbols['name'].index('_Device_Write')
+    start, end = symbols['used_in_offsets'][n:n + 2]
+    assert symbols['used_in'][start:end] == \
+        cosmic.get_symbols(_MAP)['_Device_Write'].used_in
+
+    functions = tables['functions']
+    n = functions['name'].index('_Module2_SendInfo')
+    start, end = functions['call_offsets'][n:n + 2]
+    assert [functions['name'][call]
+            for call in functions['calls'][start:end]] == ['_Device_Write']
+
+    # Map without symbols section
+    assert 'symbols' not in export.write_columnar(
+        _MAP_CALL_TREE, cosmic, io.BytesIO())
+
+    # A stream is read in one pass, the missing sections don't hide the
+    # following ones
+    for path in ["samples/cosmic/cosmic.map", "samples/cosmic/call_tree.txt"]:
+        with open(path) as f:
+            text = f.read()
+        with reader.open_map(path, reader.STREAM) as maptext:
+            assert list(export.iter_jsonl(maptext, cosmic)) == \
+                list(export.iter_jsonl(text, cosmic))
+    with reader.open_map("samples/cosmic/call_tree.txt",
+                         reader.STREAM) as maptext:
+        assert list(export.write_columnar(maptext, cosmic,
+                                          io.BytesIO())) == ['functions']
+
+
+def test_parallel_parsing():
+    from mapography import parallel
+
+    cosmic = parser.cosmic
+    ranges = cosmic.split_section(_MAP, cosmic.SYMBOLS, chunks=7)
+    assert len(ranges) > 1
+    for start, end in ranges[1:]:
+        assert not _MAP[start].isspace()
+    symbols = cosmic.get_symbols(_MAP)
+    assert ''.join([_MAP[start:end] for start, end in ranges]) == \
+        _MAP[slice(*cosmic.section_bounds(_MAP, cosmic.SYMBOLS))]
+
+    path = "samples/cosmic/cosmic.map"
+    with parallel.ParallelParser(cosmic, path, jobs=2, chunks=5) as mapparser:
+        # Only the sections asked for are parsed
+        assert mapparser.get_call_tree(_MAP).longest_path() == \
+            cosmic.get_call_tree(_MAP).longest_path()
+        assert list(mapparser.results) == [cosmic.CALL_TREE]
+        assert [str(s) for s in mapparser.get_symbols(_MAP)] == \
+            [str(s) for s in symbols]
+        assert len(mapparser.get_modules(_MAP)) == \
+            len(cosmic.get_modules(_MAP))
+        assert mapparser.PARSER_VERSION == cosmic.PARSER_VERSION
+
+    # Several sections parsed together
+    with parallel.ParallelParser(cosmic, path, jobs=2) as mapparser:
+        mapparser.prefetch(['get_modules', 'get_symbols', 'get_modules'])
+        assert sorted(mapparser.results) == sorted([cosmic.MODULES,
+                                                    cosmic.SYMBOLS])
+        assert [str(s) for s in mapparser.get_symbols(None)] == \
+            [str(s) for s in symbols]
+
+    with parallel.ParallelParser(cosmic, "samples/cosmic/call_tree.txt",
+                                 jobs=1) as mapparser:
+        # A single range is left to the calling process, the missing section
+        # to the getter
+        mapparser.prefetch(['get_call_tree', 'get_symbols'])
+        assert not mapparser.results
+        try:
+            mapparser.get_symbols(_MAP_CALL_TREE)
+        except cosmic.ParserError as e:
+            # Reported without the internal KeyError
+            assert e.__suppress_context__
+        else:
+            assert False
+
+    import gzip
+    with open('out.txt', 'wb') as f:
+        f.write(gzip.compress(_MAP.encode('utf-8')))
+    try:
+        parallel.ParallelParser(cosmic, 'out.txt', jobs=1)
+    except ValueError:
+        pass
+    else:
+        assert False, "compressed file accepted"
+
+    # The command line parses a compressed file sequentially
+    import shutil
+    import tempfile
+    from mapography.__main__ import parse_args, execute
+    directory = tempfile.mkdtemp()
+    try:
+        output = os.path.join(directory, 'longest.txt')
+        execute(*parse_args("--jobs 2 -o {} cosmic calls longest modules list "
+                            "out.txt".format(output).split()))
+        with open(output) as f:
+            assert f.read().startswith("[calls longest]\n(172, ")
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_server():
+    import asyncio
+    import threading
+    from mapography import server
+
+    with open('out.txt', 'w') as f:
+        f.write(_MAP)
+
+    # LRU and reload of the changed files
+    store = server.MapStore(max_maps=1)
+    resident = store.get('cosmic', 'out.txt')
+    assert store.get('cosmic', 'out.txt') is resident
+    store.get('cosmic', "samples/cosmic/cosmic.map")
+    assert store.get('cosmic', 'out.txt') is not resident
+    assert len(store.maps) == 1
+
+    # The address index is built once per resident map
+    args = server.parse_request_args(['cosmic', 'lookup', 'addresses',
+                                      'out.txt'])
+    assert server.run_command(store, args, '0x0') == \
+        server.run_command(store, args, '0')
+    map_file = store.get('cosmic', 'out.txt').map_file
+    assert map_file.get_address_index(map_file.maptext) is \
+        map_file.get_address_index(map_file.maptext)
+
+    # No file written on the server side
+    args = server.parse_request_args(['cosmic', 'export', 'columnar',
+                                      '--file', 'columns', 'out.txt'])
+    try:
+        server.run_command(store, args)
+    except ValueError as e:
+        assert "can't run on the server" in str(e)
+    else:
+        assert False
+
+    ports = []
+    started = threading.Event()
+    loop = asyncio.new_event_loop()
+
+    def listening(tcp_server):
+        ports.append(tcp_server.sockets[0].getsockname()[1])
+        started.set()
+
+    def serve():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+
+    task = loop.create_task(server.Server().serve(port=0, started=listening))
+    thread = threading.Thread(target=serve)
+    thread.start()
+    try:
+        assert started.wait(10)
+        with server.Client(port=ports[0]) as client:
+            query = ['cosmic', 'calls', 'longest', 'out.txt']
+            assert client.query(query) == \
+                str(parser.cosmic.get_call_tree(_MAP).longest_path())
+
+            new_map = _MAP.replace("> _main: (132)", "> _main: (200)")
+            with open('out.txt', 'w') as f:
+                f.write(new_map + '\n')
+            assert client.query(query).startswith('(240, ')
+
+            try:
+                client.query(['cosmic', 'calls', 'nothing', 'out.txt'])
+            except RuntimeError as e:
+                assert 'invalid choice' in str(e)
+            else:
+                assert False
+
+            # The server doesn't read its standard input
+            query = ['cosmic', 'lookup', 'addresses', 'out.txt']
+            try:
+                client.query(query)
+            except RuntimeError as e:
+                assert 'standard input' in str(e)
+            else:
+                assert False
+            assert client.query(query, stdin='0x0\n') == \
+                client.query(query, stdin='0\n')
+
+            assert client.query(['cosmic', '-h']).startswith('usage:')
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+        loop.close()
+
+
+def test_watch():
+    from mapography import watch
+
+    cosmic = parser.cosmic
+    incremental = watch.IncrementalParser(cosmic)
+    assert incremental.update(_MAP) == sorted(cosmic.index_sections(_MAP))
+    call_tree = incremental.get_call_tree(_MAP)
+    modules = incremental.get_modules(_MAP)
+    assert incremental.get_call_tree(_MAP) is call_tree
+
+    new_map = _MAP.replace("> _main: (132)", "> _main: (150)")
+    assert incremental.update(new_map) == [cosmic.CALL_TREE]
+    assert incremental.get_modules(new_map) is modules
+    assert incremental.get_call_tree(new_map).longest_path()[0] == 190
+
+    with open('out.txt', 'w') as f:
+        f.write(_MAP)
+    from mapography.commands import calls
+    lines = watch.watch('out.txt', cosmic, calls.longest, interval=0.01,
+                        count=2)
+    assert next(lines).startswith('(172, ')
+    stamp = os.stat('out.txt').st_mtime_ns
+    with open('out.txt', 'w') as f:
+        f.write(new_map)
+    os.utime('out.txt', ns=(stamp + 10 ** 9, stamp + 10 ** 9))
+    assert next(lines) == 'out.txt changed, changed sections: Call tree'
+    assert list(lines)[1:] == [
+        "-(172, [('_main', 132), ('_Module2_SendInfo', 12), "
+        "('_Device_Write', 28)])",
+        "+(190, [('_main', 150), ('_Module2_SendInfo', 12), "
+        "('_Device_Write', 28)])"]
+
+    # A missing file is reported, then watched for
+    import time
+    import threading
+    import contextlib
+    os.remove('out.txt')
+    lines = watch.watch('out.txt', cosmic, calls.longest, interval=0.01,
+                        count=1)
+    stderr = io.StringIO()
+    with contextlib.redirect_stderr(stderr):
+        thread = threading.Thread(target=lambda: list(lines))
+        thread.start()
+        time.sleep(0.1)
+        with open('out.txt', 'w') as f:
+            f.write(_MAP)
+        thread.join(10)
+    assert stderr.getvalue() == 'out.txt: missing, waiting for it\n'
+
+    from mapography.__main__ import parse_args
+    with contextlib.redirect_stderr(io.StringIO()):
+        try:
+            parse_args("--watch --jobs 2 cosmic calls longest "
+                       "out.txt".split())
+        except SystemExit:
+            pass
+        else:
+            assert False, "--watch accepted with --jobs"
+
+
+def test_tokenizers():
+    cosmic = parser.cosmic
+    lines = ["    1 > _main: (12)",
+             "    2     + _f: (4)",
+             "    3     |  + _g --> 2",
+             "    4     + (_h) ...",
+             "    5     + _k:(8)",
+             "    6 > _i:  (0)"]
+    tokens = cosmic.tokenize_call_tree(lines)
+    assert tokens[:4] == [(1, 0, '_main', 12, None, False),
+                          (2, 1, '_f', 4, None, False),
+                          (3, 2, '_g', None, 2, False),
+                          (4, 1, '_h', None, None, True)]
+    # Lines outside of the fast path give the same result as the regex
+    for line, token in zip(lines, tokens):
+        assert cosmic._call_tree_token(line) == token
+    assert cosmic.parse_call_tree(lines)[1:] == [
+        dict(zip(cosmic.CALL_TREE_FIELDS, token)) for token in tokens]
+
+    try:
+        cosmic.tokenize_call_tree(lines[1:])
+    except cosmic.ParserError:
+        pass
+    else:
+        assert False, "index mismatch not detected"
+
+    modules_text = cosmic.extract_modules(_MAP)
+    modules = cosmic.make_modules(cosmic.tokenize_modules(modules_text))
+    def describe(modules):
+        return [(module.name, [(segment.name, segment.start, segment.end)
+                               for segment in module.segments])
+                for module in modules]
+    assert describe(modules) == describe(
+        cosmic.make_modules(cosmic.parse_modules(modules_text)))
+    assert modules
+
+
+def test_map_file():
+    from mapography import mapfile
+    from mapography.__main__ import parse_args, execute
+
+    counts = {}
+
+    class CountingParser(object):
+        def __getattr__(self, name):
+            func = getattr(parser.cosmic, name)
+            if not name.startswith('get_'):
+                return func
+
+            def counted(*args):
+                counts[name] = counts.get(name, 0) + 1
+                return func(*args)
+            return counted
+
+    with mapfile.MapFile("samples/cosmic/cosmic.map",
+                         CountingParser()) as map_file:
+        assert counts == {}
+        call_tree = map_file.call_tree
+        assert map_file.call_tree is call_tree
+        assert map_file.run('calls', 'longest') == \
+            str(call_tree.longest_path())
+        assert map_file.run('calls', 'callers', name='_Device_Write') == \
+            '_Module2_SendInfo'
+        assert [m.name for m in map_file.modules] == \
+            [m.name for m in parser.cosmic.get_modules(_MAP)]
+        # Other contents are parsed by the parser module, not taken from the
+        # memoized objects
+        other_map = _MAP.replace("> _main: (132)", "> _main: (150)")
+        assert map_file.get_call_tree(other_map).longest_path()[0] == 190
+        assert counts == {'get_call_tree': 1, 'get_modules': 1}
+
+    # nor from the sections of a parser wrapper
+    cached_parser = cache.CachedParser(parser.cosmic,
+                                       "samples/cosmic/cosmic.map",
+                                       cache.MemoryCache())
+    with mapfile.MapFile("samples/cosmic/cosmic.map",
+                         cached_parser) as map_file:
+        assert map_file.call_tree.longest_path()[0] == 172
+        assert map_file.get_call_tree(other_map).longest_path()[0] == 190
+
+    # The sections are not indexed when the parser doesn't use the index,
+    # e.g. on a cache hit
+    class CachedTreeParser(object):
+        def index_sections(self, maptext):
+            assert False
+
+        def get_call_tree(self, maptext, index=None):
+            return 'cached'
+
+    with mapfile.MapFile("samples/cosmic/cosmic.map",
+                         CachedTreeParser()) as map_file:
+        assert map_file.call_tree == 'cached'
+
+    args_list = parse_args("-o out.txt cosmic calls longest calls callers "
+                           "_Device_Write modules sizes --totals "
+                           "samples/cosmic/cosmic.map".split())
+    assert [(args.command, args.subcommand) for args in args_list] == \
+        [('calls', 'longest'), ('calls', 'callers'), ('modules', 'sizes')]
+    assert args_list[1].name == '_Device_Write' and args_list[2].totals
+    assert all(args.i == "samples/cosmic/cosmic.map" and args.o == 'out.txt'
+               for args in args_list)
+    assert len(parse_args("cosmic calls longest "
+                          "samples/cosmic/cosmic.map".split())) == 1
+
+    execute(*args_list)
+    with open('out.txt') as f:
+        output = f.read()
+    assert output.startswith("[calls longest]\n(172, ")
+    assert "\n\n[calls callers]\n_Module2_SendInfo\n\n[modules sizes]\n" \
+        in output
+    assert output.endswith("\ntotal (620)\n")
+
+
+def test_compressed_input():
+    import bz2
+    import gzip
+    import lzma
+    import shutil
+    import tempfile
+
+    cosmic = parser.cosmic
+    directory = tempfile.mkdtemp()
+    try:
+        data = _MAP.encode('utf-8')
+        paths = {None: os.path.join(directory, 'plain.map')}
+        with open(paths[None], 'wb') as f:
+            f.write(data)
+        for name, module in [(reader.GZIP, gzip), (reader.BZIP2, bz2),
+                             (reader.XZ, lzma)]:
+            paths[name] = os.path.join(directory, name + '.map')
+            with open(paths[name], 'wb') as f:
+                f.write(module.compress(data))
+        zstd_path = os.path.join(directory, 'zstd.map')
+        with open(zstd_path, 'wb') as f:
+            f.write(b'\x28\xb5\x2f\xfd' + b'\x00' * 8)
+        assert reader.compression(zstd_path) == reader.ZSTD
+
+        for name, path in paths.items():
+            assert reader.compression(path) == name
+            with reader.open_binary(path) as f:
+                assert f.read() == data
+            for mode in reader.INPUT_MODES:
+                with reader.open_map(path, mode) as maptext:
+                    if name is not None and mode in (reader.STREAM,
+                                                     reader.AUTO):
+                        assert isinstance(maptext, reader.LineStream)
+                    assert cosmic.get_call_tree(maptext).longest_path() == \
+                        cosmic.get_call_tree(_MAP).longest_path()
+    finally:
+        shutil.rmtree(directory)
+
+
 def test_all():
     test_segment()
     test_modules()
     test_call_tree()
     test_cosmic_parser()
+    test_longest_path()
+    test_recursive_call_tree()
+    test_call_paths_selection()
+    test_index_sections()
+    test_input_modes()
+    test_cache()
+    test_batch()
+    test_compact_model()
+    test_address_index()
+    test_modules_sizes()
+    test_symbols()
+    test_diff()
+    test_history()
+    test_synthetic_map()
+    test_profiling()
+    test_draw_call_tree()
+    test_compact_call_graph()
+    test_callers_and_entry_depth()
+    test_export()
+    test_parallel_parsing()
+    test_server()
+    test_watch()
+    test_tokenizers()
+    test_map_file()
+    test_compressed_input()
 
 
 if __name__ == "__main__":